@@ -0,0 +1,240 @@
+# dispatch_benchmark.py - DefaultEventListener消息分发基准测试
+#
+# 通过真实的process_message路径测量单条消息的开销：
+#   - 在临时目录中生成N个虚拟功能模块（默认10/100/1000个）
+#   - 使用简化的EventContext和合成的MessageChain（普通闲聊、命令、@消息、被禁用的功能）
+#   - 输出每种消息的延迟分位数、吞吐量，以及tracemalloc统计的每条消息净增内存和峰值内存
+# 全程离线运行：虚拟模块不访问网络，共享HTTP客户端替换为本地的MockTransport。
+#
+# 用法：
+#   python benchmarks/dispatch_benchmark.py
+#   python benchmarks/dispatch_benchmark.py --modules 10,100 --messages 5000
+
+import argparse
+import asyncio
+import contextlib
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+import types
+from typing import Dict, List, Tuple
+
+# 添加项目根目录到Python路径
+project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+if project_root not in sys.path:
+    sys.path.insert(0, project_root)
+
+import httpx
+from langbot_plugin.api.entities import events
+from langbot_plugin.api.entities.builtin.platform import message as platform_message
+
+from components.event_listener.default import DefaultEventListener
+from core import feature_disabler
+from core import http_client
+from core import module_loader
+
+ADMIN_ID = "10000"
+GROUP_ID = "20000"
+
+MODULE_TEMPLATE = '''from typing import Dict
+
+
+def get_info() -> Dict[str, str]:
+    return {{
+        "keyword": "{keyword}",
+        "description": "基准测试模块 {index}",
+        "usage": "{usage}",
+    }}
+
+
+async def execute(event_context, request_dict) -> str:
+    return "{keyword}: " + " ".join(request_dict.get('args', []))
+'''
+
+
+class StubPlugin:
+    def __init__(self, config: Dict):
+        self.config = config
+
+    def get_config(self) -> Dict:
+        return self.config
+
+
+class StubEventContext:
+    """
+    只实现process_message用到的属性和方法
+    """
+    def __init__(self, message_chain, sender_id: str, launcher_id: str, launcher_type: str):
+        self.event = types.SimpleNamespace(
+            message_chain=message_chain,
+            sender_id=sender_id,
+            launcher_id=launcher_id,
+            launcher_type=launcher_type,
+        )
+        self.replies = []
+
+    async def reply(self, message_chain, quote_origin: bool = False):
+        self.replies.append(message_chain)
+
+    def prevent_default(self):
+        pass
+
+
+def generate_modules(func_dir: str, count: int) -> List[str]:
+    """
+    生成count个虚拟功能模块，每隔5个生成一个不需要参数（keyword等于usage）的模块
+    """
+    keywords = []
+    for index in range(count):
+        keyword = f"cmd{index}"
+        usage = keyword if index % 5 == 0 else f"{keyword} [参数]"
+        with open(os.path.join(func_dir, f"bench_{index}.py"), 'w', encoding='utf-8') as f:
+            f.write(MODULE_TEMPLATE.format(keyword=keyword, index=index, usage=usage))
+        keywords.append(keyword)
+    return keywords
+
+
+def build_scenarios(keywords: List[str]) -> Tuple[Dict[str, List], str]:
+    """
+    构造各类消息
+    返回格式：({场景名: [(message_chain, sender_id), ...]}, 需要禁用的关键词)
+    """
+    prefix_keywords = [keyword for index, keyword in enumerate(keywords) if index % 5 != 0]
+    plain = platform_message.Plain
+    at = platform_message.At
+    chain = platform_message.MessageChain
+    disabled_keyword = prefix_keywords[-1]
+    scenarios = {
+        "chatter": [
+            (chain([plain(text=text)]), "30001")
+            for text in ("今天吃什么", "哈哈哈哈哈哈", "有人在吗？", "明天见", "好的收到 没问题")
+        ],
+        "command": [
+            (chain([plain(text=f"{keyword} 参数一 参数二")]), "30001")
+            for keyword in prefix_keywords[:20]
+        ],
+        "at_mention": [
+            (chain([at(target=ADMIN_ID), plain(text=f"{keyword} ")]), "30001")
+            for keyword in prefix_keywords[:20]
+        ],
+        "disabled": [
+            (chain([plain(text=f"{disabled_keyword} 参数")]), "30001"),
+        ],
+    }
+    return scenarios, disabled_keyword
+
+
+async def dispatch(handler, message_chain, sender_id: str) -> None:
+    event_context = StubEventContext(message_chain, sender_id, GROUP_ID, "group")
+    await handler(event_context)
+
+
+def percentile(sorted_values: List[float], fraction: float) -> float:
+    index = min(len(sorted_values) - 1, int(round(fraction * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+async def run_scenario(handler, messages: List, iterations: int) -> Dict[str, float]:
+    """
+    运行一个场景，返回延迟分位数（微秒）、吞吐量和每条消息的内存占用
+    """
+    # 预热
+    for message_chain, sender_id in messages:
+        await dispatch(handler, message_chain, sender_id)
+
+    latencies = []
+    started = time.perf_counter()
+    for index in range(iterations):
+        message_chain, sender_id = messages[index % len(messages)]
+        begin = time.perf_counter_ns()
+        await dispatch(handler, message_chain, sender_id)
+        latencies.append((time.perf_counter_ns() - begin) / 1000)
+    elapsed = time.perf_counter() - started
+    latencies.sort()
+
+    # 单独测量内存分配，避免tracemalloc影响延迟数据
+    alloc_iterations = min(iterations, 500)
+    tracemalloc.start()
+    snapshot_before = tracemalloc.take_snapshot()
+    for index in range(alloc_iterations):
+        message_chain, sender_id = messages[index % len(messages)]
+        await dispatch(handler, message_chain, sender_id)
+    snapshot_after = tracemalloc.take_snapshot()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    retained = sum(stat.size_diff for stat in snapshot_after.compare_to(snapshot_before, 'filename')
+                    if stat.size_diff > 0)
+    retained_blocks = sum(stat.count_diff for stat in snapshot_after.compare_to(snapshot_before, 'filename')
+                      if stat.count_diff > 0)
+
+    return {
+        "p50": percentile(latencies, 0.50),
+        "p90": percentile(latencies, 0.90),
+        "p99": percentile(latencies, 0.99),
+        "max": latencies[-1],
+        "throughput": iterations / elapsed,
+        "retained_bytes": retained / alloc_iterations,
+        "retained_blocks": retained_blocks / alloc_iterations,
+        "peak_kb": peak / 1024,
+    }
+
+
+async def offline_transport(request: httpx.Request) -> httpx.Response:
+    return httpx.Response(200, json={})
+
+
+async def bench_module_count(count: int, iterations: int) -> Dict[str, Dict[str, float]]:
+    with tempfile.TemporaryDirectory(prefix="langbotbox-bench-") as tmp_dir:
+        func_dir = os.path.join(tmp_dir, 'func')
+        os.makedirs(func_dir)
+        keywords = generate_modules(func_dir, count)
+        scenarios, disabled_keyword = build_scenarios(keywords)
+
+        core_dir = os.path.join(project_root, 'core')
+        module_loader.registry = module_loader.ModuleRegistry([(core_dir, 'core'), (func_dir, 'func')])
+        feature_disabler.disabler = feature_disabler.FeatureDisabler(
+            config_file=os.path.join(tmp_dir, 'disabled_features.yaml')
+        )
+        http_client.configure(transport=httpx.MockTransport(offline_transport))
+
+        listener = DefaultEventListener()
+        listener.plugin = StubPlugin({"boxadmin_id": ADMIN_ID, "weather_key": "", "weather_api_host": ""})
+        await listener.initialize()
+        listener.module_watcher.stop()
+
+        feature_disabler.disable_feature(disabled_keyword)
+
+        handler = listener.registered_handlers[events.GroupMessageReceived][0]
+        results = {}
+        # process_message中的print不计入输出
+        with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+            for name, messages in scenarios.items():
+                results[name] = await run_scenario(handler, messages, iterations)
+        return results
+
+
+def print_report(count: int, results: Dict[str, Dict[str, float]]) -> None:
+    print(f"\n模块数量: {count}")
+    print(f"{'场景':<12}{'p50(us)':>10}{'p90(us)':>10}{'p99(us)':>10}{'max(us)':>10}"
+          f"{'msg/s':>12}{'B/msg':>10}{'块/msg':>10}{'峰值KB':>10}")
+    for name, stats in results.items():
+        print(f"{name:<12}{stats['p50']:>10.1f}{stats['p90']:>10.1f}{stats['p99']:>10.1f}{stats['max']:>10.1f}"
+              f"{stats['throughput']:>12.0f}{stats['retained_bytes']:>10.0f}{stats['retained_blocks']:>10.1f}"
+              f"{stats['peak_kb']:>10.1f}")
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(description="DefaultEventListener消息分发基准测试")
+    parser.add_argument("--modules", default="10,100,1000", help="生成的虚拟模块数量，逗号分隔")
+    parser.add_argument("--messages", type=int, default=2000, help="每个场景处理的消息数")
+    args = parser.parse_args()
+
+    for count in (int(item) for item in args.modules.split(",") if item):
+        results = await bench_module_count(count, args.messages)
+        print_report(count, results)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
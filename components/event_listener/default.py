@@ -5,22 +5,102 @@ from langbot_plugin.api.entities import events, context
 from langbot_plugin.api.entities.builtin.platform import message as platform_message
 from langbot_plugin.api.entities.builtin.provider import message as provider_message
 
+import asyncio
 import os
-import importlib.util
 import sys
-import re
+import time
 
 # 添加项目根目录到Python路径
 project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..'))
 if project_root not in sys.path:
     sys.path.insert(0, project_root)
 
+from core import http_client
 from core import module_loader
+from core import module_watcher
 from core import message_processor
+from core import metrics
+from core import process_pool
+from core import rate_limiter
+from core import result_cache
+from core import scheduler
+from core import single_flight
+from core import thread_offload
+
+# 预先取出各阶段的耗时直方图，每条消息只需要调用observe
+STAGES = ('extract', 'match', 'lookup', 'load', 'execute', 'convert', 'reply')
+stage_seconds = {stage: metrics.histogram('stage_seconds', stage=stage) for stage in STAGES}
+# 模块执行的默认时限（秒）
+DEFAULT_EXECUTE_TIMEOUT = 30
+
+
+async def reply_safely(event_context: context.EventContext, message_chain: platform_message.MessageChain) -> bool:
+    """
+    回复消息，捕获查询ID失效等错误，防止异常继续抛出
+    返回是否回复成功
+    """
+    started = time.perf_counter()
+    try:
+        await event_context.reply(message_chain)
+        return True
+    except Exception as e:
+        # 捕获查询ID未找到的错误
+        if "Query with query_id" in str(e) and "not found" in str(e):
+            metrics.inc('expired_queries')
+            print(f"警告: 尝试回复时查询ID已失效 - {str(e)}")
+        else:
+            metrics.inc('errors', stage='reply')
+            print(f"回复消息时发生其他错误: {str(e)}")
+        return False
+    finally:
+        stage_seconds['reply'].observe(time.perf_counter() - started)
+
+
+def get_execute_timeout(module_info: dict, default: float) -> float:
+    """
+    模块在get_info()中声明的执行时限（秒），未声明时使用全局默认值，0表示不限制
+    """
+    try:
+        return float(module_info.get('timeout', default) or 0)
+    except (TypeError, ValueError):
+        return default
+
+
+async def run_with_timeout(coro, timeout: float):
+    """
+    在时限内等待coro，超时后取消并抛出asyncio.TimeoutError，timeout为0表示不限制
+    asyncio.timeout不需要像wait_for一样额外创建任务，每条命令的开销小得多
+    """
+    if not timeout:
+        return await coro
+    if hasattr(asyncio, 'timeout'):
+        async with asyncio.timeout(timeout):
+            return await coro
+    return await asyncio.wait_for(coro, timeout)
+
+
+async def reply_text(event_context: context.EventContext, text: str) -> bool:
+    return await reply_safely(
+        event_context,
+        platform_message.MessageChain([
+            platform_message.Plain(text=text),
+        ])
+    )
 
 
 class DefaultEventListener(EventListener):
 
+    async def _unload_idle_modules(self, idle_seconds: float):
+        while True:
+            await asyncio.sleep(min(idle_seconds / 4, 300))
+            try:
+                unloaded = module_loader.registry.unload_idle(idle_seconds)
+            except Exception as e:
+                print(f"释放空闲模块失败: {e}")
+                continue
+            if unloaded:
+                print(f"已释放长时间未使用的模块: {', '.join(unloaded)}")
+
     async def initialize(self):
         await super().initialize()
 
@@ -28,6 +108,79 @@ class DefaultEventListener(EventListener):
         self.weather_key = self.plugin.get_config().get("weather_key", None)
         self.weather_host = self.plugin.get_config().get("weather_api_host", None)
         self.menu_url = self.plugin.get_config().get("menu_url", None)
+        # 模块执行的默认时限（秒），超时后取消执行，模块可以在get_info()的timeout中覆盖，0表示不限制
+        execute_timeout = self.plugin.get_config().get("execute_timeout")
+        self.execute_timeout = DEFAULT_EXECUTE_TIMEOUT if execute_timeout in (None, '') else float(execute_timeout)
+        # 全局同时执行和排队的命令数
+        scheduler.configure(
+            max_inflight=self.plugin.get_config().get("max_concurrent_commands"),
+            max_queue=self.plugin.get_config().get("max_queued_commands"),
+        )
+        # 执行阻塞模块的线程池大小
+        thread_offload.configure(
+            self.plugin.get_config().get("blocking_workers") or thread_offload.DEFAULT_MAX_WORKERS
+        )
+        # 默认的调用频率限制（次数/秒数），模块可以在get_info()的rate_limit中覆盖
+        rate_limiter.set_defaults(
+            user=self.plugin.get_config().get("rate_limit_user"),
+            group=self.plugin.get_config().get("rate_limit_group"),
+            keyword=self.plugin.get_config().get("rate_limit_keyword"),
+        )
+        # 共享HTTP客户端的设置需要在第一次请求前生效
+        http_client.configure(
+            read_timeout=self.plugin.get_config().get("http_timeout"),
+            per_host_limit=self.plugin.get_config().get("http_per_host_limit"),
+            http2=bool(self.plugin.get_config().get("http2")),
+        )
+        # 模块只能发送插件目录和配置的目录中的本地图片
+        message_processor.set_image_dirs(
+            path.strip() for path in (self.plugin.get_config().get("image_dirs") or "").split(",")
+        )
+        # 启动时扫描一次模块，之后的消息处理只读取内存索引
+        module_loader.registry.scan()
+        # 声明了process: True的模块在预热的进程池中执行
+        process_pool.configure(
+            max_workers=self.plugin.get_config().get("process_workers"),
+            max_tasks_per_worker=self.plugin.get_config().get("process_max_tasks"),
+            max_rss_mb=self.plugin.get_config().get("process_max_rss_mb"),
+        )
+        process_files = [entry.module_file for entry in module_loader.registry.get_entries()
+                         if entry.info.get('process')]
+        if process_files:
+            process_pool.start(process_files)
+        # 监听core/func目录，文件变化时只重新加载变化的模块
+        self.module_watcher = module_watcher.ModuleWatcher(module_loader.registry)
+        self.module_watcher.start()
+        # 定期释放长时间未使用的func模块，下次使用时重新导入
+        idle_minutes = float(self.plugin.get_config().get("module_idle_minutes") or 0)
+        self.idle_unload_task = None
+        if idle_minutes > 0:
+            self.idle_unload_task = asyncio.get_running_loop().create_task(
+                self._unload_idle_modules(idle_minutes * 60)
+            )
+        # 导出处理流程的耗时和计数指标（OpenMetrics格式）
+        metrics.gauge('result_cache_hits', lambda: result_cache.cache.hits)
+        metrics.gauge('result_cache_misses', lambda: result_cache.cache.misses)
+        metrics.gauge('result_cache_hit_ratio', lambda: result_cache.cache.hit_rate)
+        metrics.gauge('coalesced_requests', lambda: single_flight.flights.coalesced)
+        metrics.gauge('registered_modules', lambda: len(module_loader.get_module_info()))
+        metrics.gauge('loaded_modules', lambda: sum(
+            1 for entry in module_loader.registry.get_entries() if entry.module is not None
+        ))
+        metrics.gauge('rejected_messages', lambda: module_loader.registry.rejected)
+        metrics.gauge('rate_limit_buckets', lambda: len(rate_limiter.limiter))
+        metrics.gauge('blocking_active', lambda: thread_offload.offloader.active)
+        metrics.gauge('scheduler_inflight', lambda: scheduler.scheduler.inflight)
+        metrics.gauge('scheduler_queued', lambda: scheduler.scheduler.queued())
+        metrics.gauge('process_pool_recycled', lambda: process_pool.runner.recycled)
+        metrics.gauge('process_pool_crashes', lambda: process_pool.runner.crashes)
+        metrics.gauge('image_cache_bytes', lambda: message_processor.image_cache.current_bytes)
+        self.metrics_exporter = metrics.MetricsExporter(
+            metrics.metrics,
+            port=int(self.plugin.get_config().get("metrics_port") or 0),
+            file=self.plugin.get_config().get("metrics_file") or None,
+        )
+        await self.metrics_exporter.start()
         # 分别处理私聊和群聊消息
         @self.handler(events.PersonMessageReceived)
         async def handle_private_message(event_context: context.EventContext):
@@ -35,10 +188,12 @@ class DefaultEventListener(EventListener):
             
         @self.handler(events.GroupMessageReceived)
         async def handle_group_message(event_context: context.EventContext):
-            await process_message(event_context)
+            await process_message(event_context, str(event_context.event.launcher_id))
             
-        # 共享的消息处理函数
-        async def process_message(event_context: context.EventContext):
+        # 共享的消息处理函数，group_id为群号，私聊时为None
+        async def process_message(event_context: context.EventContext, group_id: str = None):
+            metrics.inc('messages')
+            started = time.perf_counter()
             # 获取消息内容
             message_chain = event_context.event.message_chain
             message = "".join(
@@ -55,76 +210,53 @@ class DefaultEventListener(EventListener):
             # 如果有@元素，将它们添加到消息前面
             if at_mentions:
                 message = message + " ".join(at_mentions)
+            stage_started, started = started, time.perf_counter()
+            stage_seconds['extract'].observe(started - stage_started)
             # 分割消息，获取关键词和参数
-            # 首先获取所有可用的关键词
-            available_keywords = module_loader.get_available_keywords()
-            
-            # 获取项目根目录
-            base_dir = module_loader.get_base_dir()
-            
-            # 获取目录路径
-            core_dir = os.path.join(base_dir, 'core')
-            func_dir = os.path.join(base_dir, 'func')
-            
-            # 尝试匹配关键词
-            keyword = None
-            args_text = ""
-            
-            # 获取所有模块信息，用于检查keyword和usage是否相等
-            module_info = module_loader.get_module_info()
-            
-            for kw in available_keywords:
-                # 获取该模块的usage信息
-                module_usage = module_info.get(kw, {}).get('usage', '')
-                
-                # 如果keyword等于usage，说明该功能不需要传参，只有当消息完全等于keyword时才触发
-                if kw == module_usage:
-                    if message.lower() == kw.lower() or message == kw:
-                        keyword = kw
-                        args_text = ""
-                        break
-                # 否则，保留原有的以keyword开头就触发的逻辑
-                else:
-                    if message.lower().startswith(kw.lower()) or message.startswith(kw):
-                        keyword = kw
-                        args_text = message[len(kw):].strip()
-                        break
-            
-            # 如果没有匹配到关键词，尝试使用空格分割
-            if keyword is None:
-                words = message.strip().split()
-                if not words:
-                    # await event_context.reply(
-                    #     platform_message.MessageChain([
-                    #         platform_message.Plain(text=f"请输入有效的消息内容"),
-                    #     ])
-                    # )
-                    return
-                
-                keyword = words[0]
-                args_text = message[len(keyword):].strip()
+            # 首字符不可能触发任何命令的闲聊直接跳过；否则使用注册表编译好的前缀树匹配关键词
+            # （较长的关键词优先，keyword等于usage的功能只精确匹配），再尝试消息的第一个词
+            matched = module_loader.match_command(message)
+            stage_started, started = started, time.perf_counter()
+            stage_seconds['match'].observe(started - stage_started)
+            if matched is None:
+                return
+            keyword, args_text = matched
             
             # 将参数文本分割为参数列表
             args = args_text.split() if args_text else []
             # 获取发送者ID并添加到参数列表中
             sender_id = str(event_context.event.sender_id)
             # 查找对应的功能模块文件
-            module_tuple = module_loader.find_module_by_keyword(keyword)
+            module_tuple = module_loader.find_module_by_keyword(keyword, sender_id=sender_id, group_id=group_id)
+            stage_started, started = started, time.perf_counter()
+            stage_seconds['lookup'].observe(started - stage_started)
             # 如果模块类型为feature_disabler，返回错误信息
             if module_tuple == 'feature_disabler':
-                await event_context.reply(
-                    platform_message.MessageChain([
-                        platform_message.Plain(text=f"功能 <{keyword}> 已被禁用"),
-                    ])
-                )
+                metrics.inc('disabled_hits', keyword=keyword)
+                await reply_text(event_context, f"功能 <{keyword}> 已被禁用")
                 return
             
             # 如果没有找到对应的模块，返回错误信息
             if module_tuple is None:
                 return
+            
+            module_info = module_loader.get_module_info().get(keyword, {})
+            # 在加载模块之前检查调用频率，管理员不受限制
+            if sender_id != self.admin_id:
+                limited = rate_limiter.check(keyword, module_info, sender_id, group_id)
+                if limited is not None:
+                    wait, first = limited
+                    metrics.inc('rate_limited', keyword=keyword)
+                    # 同一次限流期间只提示一次，避免刷屏
+                    if first:
+                        await reply_text(event_context, f"功能 <{keyword}> 调用太频繁，请 {max(1, int(wait + 0.999))} 秒后再试")
+                    return
+            # 从这里开始统计该功能的总耗时
+            command_started = started
             # 如果为关键词为菜单且menu_url不为空，返回menu_url
             if message == "菜单" and self.menu_url:
-                await event_context.reply(
+                await reply_safely(
+                    event_context,
                     platform_message.MessageChain([
                         platform_message.Image(url=self.menu_url),
                     ])
@@ -135,131 +267,132 @@ class DefaultEventListener(EventListener):
                 # 检查是否是启用或禁用命令
                 if args[0] in ["启用", "禁用"] and len(args) >= 2:
                     if self.admin_id == None:
-                        await event_context.reply(
-                            platform_message.MessageChain([
-                                platform_message.Plain(text="管理员ID未配置,请先配置管理员ID")
-                            ])
-                        )
+                        await reply_text(event_context, "管理员ID未配置,请先配置管理员ID")
                         return
                     # 验证管理员权限
                     if sender_id != self.admin_id:
-                        # 添加健壮的回复逻辑，防止查询ID失效导致的错误
-                        try:
-                            await event_context.reply(
-                                platform_message.MessageChain([
-                                    platform_message.Plain(text="你不是管理员，无权执行此操作"),
-                                ])
-                            )
-                        except Exception as e:
-                            # 捕获查询ID未找到的错误
-                            if "Query with query_id" in str(e) and "not found" in str(e):
-                                print(f"警告: 尝试回复时查询ID已失效 - {str(e)}")
-                            else:
-                                print(f"回复消息时发生其他错误: {str(e)}")
+                        await reply_text(event_context, "你不是管理员，无权执行此操作")
                         return
             
             # 检查是否包含--help参数
             if '--help' in args:
                 # 获取模块信息
-                module_info_dict = module_loader.get_module_info()
-                module_info = module_info_dict.get(keyword, {})
+                module_info = module_loader.get_module_info().get(keyword, {})
                 usage = module_info.get('usage', '暂无使用说明')
                 description = module_info.get('description', '暂无描述')
                 
                 # 构建帮助信息
                 help_message = f"{keyword} 功能说明：\n{description}\n\n使用方法：\n{usage}"
-                await event_context.reply(
-                    platform_message.MessageChain([
-                        platform_message.Plain(text=help_message),
-                    ])
-                )
+                await reply_text(event_context, help_message)
                 return
             
-            module_file, module_type = module_tuple
-                
-            # 动态导入对应的功能模块
-            module = module_loader.load_module(module_file, keyword)
-            if module is None:
-                await event_context.reply(
-                    platform_message.MessageChain([
-                        platform_message.Plain(text=f"加载模块 {keyword} 失败"),
-                    ])
-                )
-                return
+            # 创建参数字典，包含请求内容和请求者ID
+            request_dict = {
+                'args': args,  # 原始参数列表
+                'args_text': args_text,  # 原始参数字符串
+                'sender_id': sender_id,  # 请求者ID
+                'group_id': group_id,  # 群号，私聊时为None
+                'message': message,  # 完整消息内容
+                'http_client': http_client.get_client()  # 共享的异步HTTP客户端
+            }
             
-            try:
-                # 调用模块中的execute函数
-                if hasattr(module, 'execute'):
-                    # 创建参数字典，包含请求内容和请求者ID
-                    request_dict = {
-                        'args': args,  # 原始参数列表
-                        'args_text': args_text,  # 原始参数字符串
-                        'sender_id': sender_id,  # 请求者ID
-                        'message': message  # 完整消息内容
-                    }
-                    
-                    # 如果是天气功能，添加weather_key参数
-                    if keyword == "天气":
-                        request_dict['weather_key'] = self.weather_key
-                        request_dict['weather_host'] = self.weather_host
+            # 如果是天气功能，添加weather_key参数
+            if keyword == "天气":
+                request_dict['weather_key'] = self.weather_key
+                request_dict['weather_host'] = self.weather_host
+            
+            # 模块在get_info()中声明了缓存策略时，命中缓存直接回复，不再加载和执行模块
+            cache_key = result_cache.make_key(keyword, module_info, request_dict, module_loader.registry.version)
+            result = result_cache.get_cached(cache_key)
+            
+            if result is None:
+                if module_info.get('process'):
+                    # CPU密集型模块在进程池中导入和执行，主进程不加载模块
+                    module_file = module_tuple[0]
+                    run_execute = lambda: process_pool.run(module_file, request_dict)
+                else:
+                    # 从注册表获取功能模块，首次使用时导入
+                    load_started = time.perf_counter()
+                    module = module_loader.get_module(keyword)
+                    stage_seconds['load'].observe(time.perf_counter() - load_started)
+                    if module is None:
+                        metrics.inc('errors', stage='load', keyword=keyword)
+                        await reply_text(event_context, f"加载模块 {keyword} 失败")
+                        return
                     
-                    # 只传递request_dict参数，不再使用args
-                    result = await module.execute(event_context, request_dict)
-                    # 获取发送者ID event.sender.id
-                    sender_id = str(event_context.event.sender_id)
-                    # 检查模块是否提供了是否需要@用户的配置
-                    need_at = False
-                    if hasattr(module, 'get_info'):
-                        try:
-                            module_info = module.get_info()
-                            if isinstance(module_info, dict) and 'need_at' in module_info:
-                                need_at = bool(module_info['need_at'])
-                        except:
-                            pass
-                    # 使用MessageProcessor处理消息
-                    try:
-                        message_parts = message_processor.MessageProcessor.convert_message(result, sender_id, need_at)
-                    except Exception as e:
-                        # 如果消息处理失败，使用简单文本回复并记录错误
-                        # print(f'Message processing error: {e}')
-                        message_parts = [platform_message.Plain(text=str(result))]
+                    if not hasattr(module, 'execute'):
+                        metrics.inc('errors', stage='load', keyword=keyword)
+                        await reply_text(event_context, f"模块 {keyword} 中没有找到execute函数")
+                        return
                     
-                    # 添加健壮的回复逻辑，防止查询ID失效导致的错误
-                    try:
-                        await event_context.reply(
-                            platform_message.MessageChain(message_parts)
-                        )
-                        event_context.prevent_default()
-                        # event_context.prevent_postorder()
-                    except Exception as e:
-                        # 捕获查询ID未找到的错误
-                        if "Query with query_id" in str(e) and "not found" in str(e):
-                            print(f"警告: 尝试回复时查询ID已失效 - {str(e)}")
-                            # 可以选择记录日志或不做任何操作，避免继续抛出异常
-                        else:
-                            # 其他错误仍然需要处理
-                            print(f"回复消息时发生其他错误: {str(e)}")
+                    if module_info.get('blocking'):
+                        # 包含阻塞调用的模块在线程池中执行，共享的HTTP客户端会为线程中的事件循环单独创建连接，
+                        # event_context的异步方法（例如reply）通过代理回到主事件循环执行
+                        thread_context = thread_offload.proxy(event_context)
+                        run_execute = lambda: thread_offload.run(module.execute, thread_context, request_dict)
+                    else:
+                        run_execute = lambda: module.execute(event_context, request_dict)
+                
+                # 模块开启了请求合并时，相同的并发请求共享同一次执行
+                flight_key = single_flight.make_key(keyword, module_info, request_dict, module_loader.registry.version)
+                timeout = get_execute_timeout(module_info, self.execute_timeout)
+                # 管理员和私聊的命令优先于群聊执行
+                if sender_id == self.admin_id:
+                    priority = scheduler.PRIORITY_ADMIN
+                elif group_id is None:
+                    priority = scheduler.PRIORITY_PRIVATE
                 else:
-                    try:
-                        await event_context.reply(
-                            platform_message.MessageChain([
-                                platform_message.Plain(text=f"模块 {keyword} 中没有找到execute函数"),
-                            ])
-                        )
-                    except Exception as reply_error:
-                        if "Query with query_id" in str(reply_error) and "not found" in str(reply_error):
-                            print(f"警告: 尝试回复时查询ID已失效 - {str(reply_error)}")
-                        else:
-                            print(f"回复消息时发生其他错误: {str(reply_error)}")
-            except Exception as e:
+                    priority = scheduler.PRIORITY_GROUP
+                execute_started = time.perf_counter()
                 try:
-                    await event_context.reply(
-                        platform_message.MessageChain([
-                            platform_message.Plain(text=f"执行功能时出错: {str(e)}"),
-                        ])
+                    # 调用模块中的execute函数，只传递request_dict参数，不再使用args
+                    # 合并后的执行只占用一个调度名额；时限只计算执行时间，不包括排队时间，
+                    # 超时后执行被取消，所有合并的请求都收到超时提示
+                    result = await single_flight.run(
+                        flight_key,
+                        lambda: scheduler.run(
+                            keyword,
+                            lambda: run_with_timeout(run_execute(), timeout),
+                            module_info.get('max_concurrency'),
+                            priority,
+                        )
                     )
-                except Exception as reply_error:
-                    if "Query with query_id" in str(reply_error) and "not found" in str(reply_error):
-                        print(f"警告: 尝试回复时查询ID已失效 - {str(reply_error)}")
-                    else:
-                        print(f"回复消息时发生其他错误: {str(reply_error)}")
\ No newline at end of file
+                except scheduler.SchedulerBusy:
+                    metrics.inc('busy_rejections', keyword=keyword)
+                    await reply_text(event_context, "当前请求较多，请稍后再试")
+                    return
+                except asyncio.TimeoutError:
+                    metrics.inc('timeouts', keyword=keyword)
+                    await reply_text(event_context, f"功能 <{keyword}> 执行超时（{timeout:g}秒），请稍后再试")
+                    return
+                except Exception as e:
+                    metrics.inc('errors', stage='execute', keyword=keyword)
+                    await reply_text(event_context, f"执行功能时出错: {str(e)}")
+                    return
+                finally:
+                    execute_seconds = time.perf_counter() - execute_started
+                    stage_seconds['execute'].observe(execute_seconds)
+                    metrics.observe('execute_seconds', execute_seconds, keyword=keyword)
+                
+                result_cache.store(cache_key, module_info, result)
+            
+            # 检查模块是否提供了是否需要@用户的配置
+            need_at = bool(module_info.get('need_at', False))
+            # 使用MessageProcessor处理消息
+            convert_started = time.perf_counter()
+            try:
+                messages = await message_processor.MessageProcessor.split_messages_async(result, sender_id, need_at)
+            except Exception as e:
+                # 如果消息处理失败，使用简单文本回复并记录错误
+                metrics.inc('errors', stage='convert', keyword=keyword)
+                messages = [[platform_message.Plain(text=str(result))]]
+            stage_seconds['convert'].observe(time.perf_counter() - convert_started)
+            
+            # 结果中包含<!--break-->时按顺序分多条消息发送
+            replied = False
+            for message_parts in messages:
+                replied = await reply_safely(event_context, platform_message.MessageChain(message_parts)) or replied
+            if replied:
+                event_context.prevent_default()
+                # event_context.prevent_postorder()
+            metrics.observe('command_seconds', time.perf_counter() - command_started, keyword=keyword)
@@ -1,16 +1,53 @@
+import asyncio
+import atexit
 import os
+import time
 import yaml
-from typing import List, Set
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+# 修改禁用列表后延迟写入的时间（秒），期间的多次修改合并为一次写入
+SAVE_DEBOUNCE = 1.0
+# 检查配置文件是否被外部修改的最小间隔（秒）
+CHECK_INTERVAL = 2.0
+
+# 禁用/启用的作用范围
+SCOPE_GLOBAL = 'global'
+SCOPE_GROUP = 'group'
+SCOPE_USER = 'user'
+
+
+class _Policy:
+    """
+    单个群或用户的策略，allow和deny是以功能ID为位序号的位图
+    """
+    __slots__ = ('allow', 'deny')
+
+    def __init__(self, allow: int = 0, deny: int = 0):
+        self.allow = allow
+        self.deny = deny
+
 
 class FeatureDisabler:
     """
     功能禁用管理类，处理YAML格式的禁用名单
+
+    除全局禁用名单外，还可以针对单个群或用户禁用（deny）或单独启用（allow）功能，
+    优先级为 用户 > 群 > 全局。每个功能分配一个整数ID，群和用户的策略保存为位图，
+    判断是否禁用只需要常数次字典查询和位运算，与群和用户的数量无关。
+
+    禁用状态保存在内存中，修改后在事件循环外合并写入（先写临时文件再替换）。
+    配置文件被手动编辑或被其他实例修改时，根据mtime和大小自动重新加载。
     """
-    def __init__(self):
+    def __init__(self, config_file: str = None, save_debounce: float = SAVE_DEBOUNCE,
+                 check_interval: float = CHECK_INTERVAL):
         # 获取config目录路径
         self.base_dir = os.path.dirname(os.path.dirname(__file__))
-        self.config_dir = os.path.join(self.base_dir, 'config')
-        self.config_file = os.path.join(self.config_dir, 'disabled_features.yaml')
+        if config_file is None:
+            config_file = os.path.join(self.base_dir, 'config', 'disabled_features.yaml')
+        self.config_file = config_file
+        self.config_dir = os.path.dirname(config_file)
+        self.save_debounce = save_debounce
+        self.check_interval = check_interval
         
         # 确保config目录存在
         if not os.path.exists(self.config_dir):
@@ -18,61 +55,268 @@ class FeatureDisabler:
             
         # 确保配置文件存在
         if not os.path.exists(self.config_file):
-            self._save_disabled_features(set())
+            self._write_file({'disabled_features': []})
             
+        # 禁用列表每次变化时递增，供依赖禁用状态的缓存判断是否失效
+        self.version = 0
+        # 最近一次读取或写入时配置文件的(mtime, 大小)
+        self._file_stat: Optional[Tuple[int, int]] = None
+        self._next_check = 0.0
+        self._save_handle: Optional[asyncio.TimerHandle] = None
+        self._dirty = False
+        self._saving = False
+        # 功能名与功能ID（位序号）的对应关系，只增不减，重新加载配置时重建
+        self._feature_ids: Dict[str, int] = {}
+        self._feature_names: List[str] = []
+        self._group_policies: Dict[str, _Policy] = {}
+        self._user_policies: Dict[str, _Policy] = {}
         self._disabled_features = self._load_disabled_features()
     
+    def _stat_file(self) -> Optional[Tuple[int, int]]:
+        try:
+            stat = os.stat(self.config_file)
+        except OSError:
+            return None
+        return stat.st_mtime_ns, stat.st_size
+    
     def _load_disabled_features(self) -> Set[str]:
         """
-        从YAML文件加载禁用的功能列表
+        从YAML文件加载禁用的功能列表，同时重建群和用户的策略
         """
+        self._file_stat = self._stat_file()
+        self._feature_ids = {}
+        self._feature_names = []
+        self._group_policies = {}
+        self._user_policies = {}
         try:
             with open(self.config_file, 'r', encoding='utf-8') as f:
-                data = yaml.safe_load(f)
-                if data and 'disabled_features' in data:
-                    return set(data['disabled_features'])
+                data = yaml.safe_load(f) or {}
+            self._group_policies = self._parse_policies(data.get('group_policies'))
+            self._user_policies = self._parse_policies(data.get('user_policies'))
+            return set(data.get('disabled_features') or [])
         except Exception as e:
             print(f"加载禁用功能列表失败: {e}")
         return set()
     
-    def _save_disabled_features(self, disabled_features: Set[str]) -> None:
+    def _parse_policies(self, data: Optional[Dict[Any, Dict[str, List[str]]]]) -> Dict[str, _Policy]:
+        policies = {}
+        for target, policy in (data or {}).items():
+            policy = policy or {}
+            allow = self._names_to_bits(policy.get('allow') or [])
+            deny = self._names_to_bits(policy.get('deny') or [])
+            if allow or deny:
+                policies[str(target)] = _Policy(allow, deny)
+        return policies
+    
+    def _feature_bit(self, feature_name: str) -> int:
         """
-        将禁用的功能列表保存到YAML文件
+        返回功能对应的位，第一次出现的功能分配新的ID
         """
+        feature_id = self._feature_ids.get(feature_name)
+        if feature_id is None:
+            feature_id = self._feature_ids[feature_name] = len(self._feature_names)
+            self._feature_names.append(feature_name)
+        return 1 << feature_id
+    
+    def _names_to_bits(self, feature_names: List[str]) -> int:
+        bits = 0
+        for feature_name in feature_names:
+            bits |= self._feature_bit(str(feature_name))
+        return bits
+    
+    def _bits_to_names(self, bits: int) -> List[str]:
+        names = []
+        while bits:
+            lowest = bits & -bits
+            names.append(self._feature_names[lowest.bit_length() - 1])
+            bits ^= lowest
+        return sorted(names)
+    
+    def _dump_policies(self, policies: Dict[str, _Policy]) -> Dict[str, Dict[str, List[str]]]:
+        data = {}
+        for target, policy in sorted(policies.items()):
+            item = {}
+            if policy.allow:
+                item['allow'] = self._bits_to_names(policy.allow)
+            if policy.deny:
+                item['deny'] = self._bits_to_names(policy.deny)
+            data[target] = item
+        return data
+    
+    def _snapshot(self) -> Dict[str, Any]:
+        """
+        生成要写入文件的数据，在事件循环中调用，写入线程只处理这份拷贝
+        """
+        data: Dict[str, Any] = {'disabled_features': sorted(self._disabled_features)}
+        if self._group_policies:
+            data['group_policies'] = self._dump_policies(self._group_policies)
+        if self._user_policies:
+            data['user_policies'] = self._dump_policies(self._user_policies)
+        return data
+    
+    def _write_file(self, data: Dict[str, Any]) -> None:
+        """
+        将禁用配置写入YAML文件，先写临时文件再替换，写入中断时不会损坏原文件
+        """
+        # 确保config目录存在
+        if not os.path.exists(self.config_dir):
+            os.makedirs(self.config_dir)
+            
+        tmp_file = f"{self.config_file}.{os.getpid()}.tmp"
+        with open(tmp_file, 'w', encoding='utf-8') as f:
+            yaml.dump(data, f, allow_unicode=True, default_flow_style=False)
+        os.replace(tmp_file, self.config_file)
+        self._file_stat = self._stat_file()
+    
+    def _check_external_change(self) -> None:
+        """
+        配置文件被外部修改时重新加载，最多每check_interval秒检查一次
+        有尚未写入的修改时以内存中的状态为准
+        """
+        now = time.monotonic()
+        if now < self._next_check:
+            return
+        self._next_check = now + self.check_interval
+        if self._dirty or self._saving:
+            return
+        if self._stat_file() != self._file_stat:
+            self._disabled_features = self._load_disabled_features()
+            self.version += 1
+    
+    def _schedule_save(self) -> None:
+        """
+        标记需要保存，在事件循环中延迟合并写入，没有运行中的事件循环时直接写入
+        """
+        self._dirty = True
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            self.flush()
+            return
+        if self._save_handle is None:
+            self._save_handle = loop.call_later(self.save_debounce, self._start_save)
+    
+    def _start_save(self) -> None:
+        self._save_handle = None
+        if self._saving:
+            # 上一次写入完成后会再次检查
+            return
+        asyncio.get_running_loop().create_task(self._save_in_thread())
+    
+    async def _save_in_thread(self) -> None:
+        self._saving = True
+        try:
+            while self._dirty:
+                self._dirty = False
+                snapshot = self._snapshot()
+                try:
+                    await asyncio.to_thread(self._write_file, snapshot)
+                except Exception as e:
+                    print(f"保存禁用功能列表失败: {e}")
+        finally:
+            self._saving = False
+    
+    def flush(self) -> None:
+        """
+        立即写入尚未保存的修改
+        """
+        if self._save_handle is not None:
+            self._save_handle.cancel()
+            self._save_handle = None
+        if not self._dirty:
+            return
+        self._dirty = False
         try:
-            # 确保config目录存在
-            if not os.path.exists(self.config_dir):
-                os.makedirs(self.config_dir)
-                
-            data = {'disabled_features': list(disabled_features)}
-            with open(self.config_file, 'w', encoding='utf-8') as f:
-                yaml.dump(data, f, allow_unicode=True, default_flow_style=False)
+            self._write_file(self._snapshot())
         except Exception as e:
             print(f"保存禁用功能列表失败: {e}")
     
-    def is_disabled(self, feature_name: str) -> bool:
+    def is_disabled(self, feature_name: str, group_id: Optional[str] = None,
+                    user_id: Optional[str] = None) -> bool:
         """
-        检查功能是否被禁用
+        检查功能是否被禁用，传入群号和用户ID时依次检查用户、群的策略，都未设置时使用全局名单
         """
+        self._check_external_change()
+        if self._user_policies or self._group_policies:
+            feature_id = self._feature_ids.get(feature_name)
+            if feature_id is not None:
+                bit = 1 << feature_id
+                if user_id is not None:
+                    policy = self._user_policies.get(user_id)
+                    if policy is not None:
+                        if policy.deny & bit:
+                            return True
+                        if policy.allow & bit:
+                            return False
+                if group_id is not None:
+                    policy = self._group_policies.get(group_id)
+                    if policy is not None:
+                        if policy.deny & bit:
+                            return True
+                        if policy.allow & bit:
+                            return False
         return feature_name in self._disabled_features
     
-    def disable_feature(self, feature_name: str) -> bool:
+    def _scope_policies(self, scope: str) -> Dict[str, _Policy]:
+        if scope == SCOPE_GROUP:
+            return self._group_policies
+        if scope == SCOPE_USER:
+            return self._user_policies
+        raise ValueError(f"未知的作用范围: {scope}")
+    
+    def _set_policy(self, feature_name: str, scope: str, target: str, disabled: bool) -> bool:
+        """
+        修改群或用户的策略，返回策略是否发生变化
+        启用时如果功能在全局被禁用，为该群或用户单独允许
+        """
+        policies = self._scope_policies(scope)
+        target = str(target)
+        bit = self._feature_bit(feature_name)
+        policy = policies.get(target) or _Policy()
+        if disabled:
+            allow, deny = policy.allow & ~bit, policy.deny | bit
+        else:
+            allow, deny = policy.allow, policy.deny & ~bit
+            if feature_name in self._disabled_features:
+                allow |= bit
+        if (allow, deny) == (policy.allow, policy.deny):
+            return False
+        if allow or deny:
+            policy.allow, policy.deny = allow, deny
+            policies[target] = policy
+        else:
+            policies.pop(target, None)
+        self.version += 1
+        self._schedule_save()
+        return True
+    
+    def disable_feature(self, feature_name: str, scope: str = SCOPE_GLOBAL,
+                        target: Optional[str] = None) -> bool:
         """
-        禁用指定功能
+        禁用指定功能，scope为SCOPE_GROUP或SCOPE_USER时只对target指定的群或用户生效
         """
+        self._check_external_change()
+        if scope != SCOPE_GLOBAL:
+            return self._set_policy(feature_name, scope, target, True)
         if feature_name not in self._disabled_features:
             self._disabled_features.add(feature_name)
-            self._save_disabled_features(self._disabled_features)
+            self.version += 1
+            self._schedule_save()
             return True
         return False
     
-    def enable_feature(self, feature_name: str) -> bool:
+    def enable_feature(self, feature_name: str, scope: str = SCOPE_GLOBAL,
+                       target: Optional[str] = None) -> bool:
         """
-        启用指定功能
+        启用指定功能，scope为SCOPE_GROUP或SCOPE_USER时只对target指定的群或用户生效
         """
+        self._check_external_change()
+        if scope != SCOPE_GLOBAL:
+            return self._set_policy(feature_name, scope, target, False)
         if feature_name in self._disabled_features:
             self._disabled_features.remove(feature_name)
-            self._save_disabled_features(self._disabled_features)
+            self.version += 1
+            self._schedule_save()
             return True
         return False
     
@@ -80,20 +324,45 @@ class FeatureDisabler:
         """
         获取所有被禁用的功能
         """
+        self._check_external_change()
         return list(self._disabled_features)
+    
+    def get_policies(self, scope: str) -> Dict[str, Dict[str, List[str]]]:
+        """
+        获取群或用户的策略
+        返回格式：{群号或用户ID: {'allow': [功能名], 'deny': [功能名]}}
+        """
+        self._check_external_change()
+        return self._dump_policies(self._scope_policies(scope))
+    
+    def get_version(self) -> int:
+        self._check_external_change()
+        return self.version
 
 # 创建全局实例
 disabler = FeatureDisabler()
 
+# 退出时写入尚未保存的修改，使用函数以便disabler被替换后仍然生效
+atexit.register(lambda: disabler.flush())
+
 # 提供便捷函数
-def is_disabled(feature_name: str) -> bool:
-    return disabler.is_disabled(feature_name)
+def is_disabled(feature_name: str, group_id: Optional[str] = None, user_id: Optional[str] = None) -> bool:
+    return disabler.is_disabled(feature_name, group_id, user_id)
 
-def disable_feature(feature_name: str) -> bool:
-    return disabler.disable_feature(feature_name)
+def disable_feature(feature_name: str, scope: str = SCOPE_GLOBAL, target: Optional[str] = None) -> bool:
+    return disabler.disable_feature(feature_name, scope, target)
 
-def enable_feature(feature_name: str) -> bool:
-    return disabler.enable_feature(feature_name)
+def enable_feature(feature_name: str, scope: str = SCOPE_GLOBAL, target: Optional[str] = None) -> bool:
+    return disabler.enable_feature(feature_name, scope, target)
 
 def get_disabled_features() -> List[str]:
-    return disabler.get_disabled_features()
\ No newline at end of file
+    return disabler.get_disabled_features()
+
+def get_policies(scope: str) -> Dict[str, Dict[str, List[str]]]:
+    return disabler.get_policies(scope)
+
+def get_version() -> int:
+    return disabler.get_version()
+
+def flush() -> None:
+    disabler.flush()
@@ -0,0 +1,160 @@
+# http_client.py - 插件共享的异步HTTP客户端
+
+import asyncio
+import importlib.util
+import weakref
+from typing import Dict, Optional
+from urllib.parse import urlsplit
+
+import httpx
+
+# 默认超时（秒）
+DEFAULT_CONNECT_TIMEOUT = 5.0
+DEFAULT_READ_TIMEOUT = 15.0
+# 连接池大小
+DEFAULT_MAX_CONNECTIONS = 100
+DEFAULT_MAX_KEEPALIVE_CONNECTIONS = 20
+# 单个主机同时进行的请求数上限
+DEFAULT_PER_HOST_LIMIT = 10
+
+
+class _LoopState:
+    """
+    绑定在某个事件循环上的客户端和按主机的信号量
+    """
+    __slots__ = ("client", "host_semaphores", "__weakref__")
+
+    def __init__(self):
+        self.client: Optional[httpx.AsyncClient] = None
+        self.host_semaphores: Dict[str, asyncio.Semaphore] = {}
+
+
+class SharedHttpClient:
+    """
+    所有功能模块共用的异步HTTP客户端
+
+    - 复用同一个httpx.AsyncClient，保持长连接
+    - 限制总连接数和单个主机的并发请求数，一个慢接口不会占满连接池
+    - 默认设置连接和读取超时，避免请求无限等待
+    - 安装了h2时可选开启HTTP/2
+    - httpx.AsyncClient和asyncio.Semaphore只能在创建它们的事件循环中使用，
+      因此每个事件循环（主事件循环、线程池中各线程的事件循环）各有一份，事件循环被回收后随之释放
+    """
+    def __init__(self,
+                 connect_timeout: float = DEFAULT_CONNECT_TIMEOUT,
+                 read_timeout: float = DEFAULT_READ_TIMEOUT,
+                 max_connections: int = DEFAULT_MAX_CONNECTIONS,
+                 max_keepalive_connections: int = DEFAULT_MAX_KEEPALIVE_CONNECTIONS,
+                 per_host_limit: int = DEFAULT_PER_HOST_LIMIT,
+                 http2: bool = False,
+                 transport: Optional[httpx.AsyncBaseTransport] = None):
+        self.timeout = httpx.Timeout(read_timeout, connect=connect_timeout)
+        self.limits = httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_keepalive_connections,
+        )
+        self.per_host_limit = per_host_limit
+        self.http2 = self._check_http2(http2)
+        # 自定义传输层，例如测试和基准中使用的httpx.MockTransport，为None时使用默认的网络连接
+        self.transport = transport
+        self._states: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, _LoopState]" = weakref.WeakKeyDictionary()
+
+    @staticmethod
+    def _check_http2(http2: bool) -> bool:
+        # HTTP/2需要额外安装h2包
+        if http2 and importlib.util.find_spec("h2") is None:
+            print("未安装h2，HTTP/2未启用")
+            return False
+        return bool(http2)
+
+    def configure(self, read_timeout: float = None, connect_timeout: float = None,
+                  per_host_limit: int = None, http2: bool = None,
+                  transport: Optional[httpx.AsyncBaseTransport] = None) -> None:
+        """
+        修改超时、单个主机的并发数、HTTP/2设置和传输层，应在第一次请求前调用
+        已经创建的客户端保持原有设置，按主机的信号量会按新的并发数重新创建；
+        更换传输层时已经创建的客户端被丢弃，之后的请求都经过新的传输层
+        """
+        if read_timeout or connect_timeout:
+            self.timeout = httpx.Timeout(
+                float(read_timeout or self.timeout.read),
+                connect=float(connect_timeout or self.timeout.connect),
+            )
+        if per_host_limit:
+            self.per_host_limit = max(1, int(per_host_limit))
+            for state in list(self._states.values()):
+                state.host_semaphores = {}
+        if http2 is not None:
+            self.http2 = self._check_http2(http2)
+        if transport is not None and transport is not self.transport:
+            self.transport = transport
+            for state in list(self._states.values()):
+                state.client = None
+
+    def _state(self) -> _LoopState:
+        loop = asyncio.get_running_loop()
+        state = self._states.get(loop)
+        if state is None:
+            state = self._states[loop] = _LoopState()
+        return state
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        """
+        当前事件循环的httpx.AsyncClient，首次使用时创建，必须在事件循环中访问
+        """
+        state = self._state()
+        if state.client is None or state.client.is_closed:
+            state.client = httpx.AsyncClient(
+                timeout=self.timeout,
+                limits=self.limits,
+                http2=self.http2,
+                transport=self.transport,
+                # 与requests的默认行为保持一致
+                follow_redirects=True,
+            )
+        return state.client
+
+    def _host_semaphore(self, url: str) -> asyncio.Semaphore:
+        host = urlsplit(str(url)).netloc
+        semaphores = self._state().host_semaphores
+        semaphore = semaphores.get(host)
+        if semaphore is None:
+            semaphore = semaphores[host] = asyncio.Semaphore(self.per_host_limit)
+        return semaphore
+
+    async def request(self, method: str, url: str, **kwargs) -> httpx.Response:
+        """
+        发送请求，参数与httpx.AsyncClient.request相同
+        """
+        async with self._host_semaphore(url):
+            return await self.client.request(method, url, **kwargs)
+
+    async def get(self, url: str, **kwargs) -> httpx.Response:
+        return await self.request("GET", url, **kwargs)
+
+    async def post(self, url: str, **kwargs) -> httpx.Response:
+        return await self.request("POST", url, **kwargs)
+
+    async def aclose(self) -> None:
+        """
+        关闭当前事件循环的客户端
+        """
+        state = self._states.get(asyncio.get_running_loop())
+        if state is not None and state.client is not None:
+            await state.client.aclose()
+            state.client = None
+
+
+# 创建全局实例
+client = SharedHttpClient()
+
+
+def get_client() -> SharedHttpClient:
+    return client
+
+def configure(read_timeout: float = None, connect_timeout: float = None,
+              per_host_limit: int = None, http2: bool = None,
+              transport: Optional[httpx.AsyncBaseTransport] = None) -> None:
+    client.configure(read_timeout, connect_timeout, per_host_limit, http2, transport)
+
@@ -0,0 +1,165 @@
+# keyword_matcher.py - 关键词前缀树匹配器和正则触发器
+
+import re
+from typing import Dict, Iterable, List, Optional, Pattern, Tuple
+
+# 合并后分组序号会变化，使用编号反向引用或按编号引用分组的条件表达式的模式无法合并
+NUMBERED_REFERENCE = re.compile(r'\\[1-9]|\(\?\(\d')
+# 模式开头的全局标志，例如(?i)，合并时需要改成只作用于该模式的(?i:...)
+GLOBAL_FLAGS = re.compile(r'^\(\?([aiLmsux]+)\)')
+
+
+class _TrieNode:
+    __slots__ = ("children", "keywords")
+
+    def __init__(self):
+        self.children: Dict[str, "_TrieNode"] = {}
+        # 以该节点结尾的关键词：[(匹配后返回的关键词, 是否仅精确匹配), ...]
+        # 忽略大小写后相同的关键词会落在同一节点，按添加顺序保存
+        self.keywords: List[Tuple[str, bool]] = []
+
+
+class KeywordMatcher:
+    """
+    把关键词集合编译为忽略大小写的前缀树
+
+    匹配规则与原先逐个比较关键词的逻辑一致：
+    - keyword等于usage的功能不需要传参，只有消息完全等于关键词时才触发
+    - 其他功能只要消息以关键词开头即触发
+    - 多个关键词都能匹配时，优先较长的关键词
+
+    - 别名与关键词一样加入前缀树，匹配后返回它所指向的关键词
+
+    匹配时只沿着消息走一遍前缀树，耗时与消息长度（最多为最长关键词长度）相关，与关键词数量无关
+    """
+    def __init__(self, keywords: Iterable[Tuple[str, bool]] = ()):
+        self._root = _TrieNode()
+        for keyword, exact in keywords:
+            self.add(keyword, exact)
+
+    def add(self, keyword: str, exact: bool = False, target: Optional[str] = None) -> None:
+        """
+        添加关键词，忽略大小写后相同的关键词按添加顺序优先
+        target不为空时keyword作为别名，匹配后返回target
+        """
+        if not keyword:
+            return
+        node = self._root
+        for ch in keyword:
+            for folded in ch.lower():
+                child = node.children.get(folded)
+                if child is None:
+                    child = node.children[folded] = _TrieNode()
+                node = child
+        node.keywords.append((target or keyword, exact))
+
+    def find(self, keyword: str) -> Optional[str]:
+        """
+        返回与keyword忽略大小写后相同、已经添加过的关键词（别名返回它指向的关键词），没有时返回None
+        """
+        node = self._root
+        for ch in keyword:
+            for folded in ch.lower():
+                node = node.children.get(folded)
+                if node is None:
+                    return None
+        return node.keywords[0][0] if node.keywords else None
+
+    def match(self, message: str) -> Optional[Tuple[str, str]]:
+        """
+        匹配消息开头的关键词
+        返回格式：(keyword, args_text) 或 None
+        """
+        # 记录沿途经过的关键词结尾：(节点, 消息中对应的结束位置)
+        candidates: List[Tuple[_TrieNode, int]] = []
+        node = self._root
+        for index, ch in enumerate(message):
+            for folded in ch.lower():
+                node = node.children.get(folded)
+                if node is None:
+                    break
+            if node is None:
+                break
+            if node.keywords:
+                candidates.append((node, index + 1))
+
+        # 从最长的候选开始检查
+        for node, end in reversed(candidates):
+            for keyword, exact in node.keywords:
+                if not exact:
+                    return keyword, message[end:].strip()
+                if end == len(message):
+                    return keyword, ""
+        return None
+
+
+class PatternMatcher:
+    """
+    把各模块声明的正则触发器合并为一个正则表达式
+
+    每个模式包在一个外层分组中用|连接，匹配时只调用一次re.match（从消息开头匹配），
+    根据最后结束的分组（即命中模式的外层分组）找到对应的关键词，耗时与模式数量基本无关。
+    无效的模式、能匹配空消息的模式以及无法合并的模式会被忽略并打印原因。
+    """
+    def __init__(self, patterns: Iterable[Tuple[str, str]] = ()):
+        """
+        Args:
+            patterns: [(keyword, pattern), ...]，靠前的模式优先
+        """
+        # 已接受的模式：[(keyword, 原始模式, 单独编译的正则), ...]
+        self.patterns: List[Tuple[str, str, Pattern]] = []
+        self._targets: Dict[int, str] = {}
+        self._regex: Optional[Pattern] = None
+
+        parts = []
+        group_names = set()
+        group = 1
+        for keyword, pattern in patterns:
+            try:
+                compiled = re.compile(pattern)
+            except (re.error, TypeError) as e:
+                print(f"模块 {keyword} 的触发模式 {pattern!r} 无效: {e}")
+                continue
+            if compiled.match(""):
+                print(f"模块 {keyword} 的触发模式 {pattern!r} 能匹配任意消息，已忽略")
+                continue
+            if NUMBERED_REFERENCE.search(pattern):
+                print(f"模块 {keyword} 的触发模式 {pattern!r} 使用了编号引用，请改用命名分组 (?P<name>...) 和 (?P=name)")
+                continue
+            duplicated = group_names.intersection(compiled.groupindex)
+            if duplicated:
+                print(f"模块 {keyword} 的触发模式 {pattern!r} 的分组名 {', '.join(sorted(duplicated))} 与其他模式重复，已忽略")
+                continue
+            group_names.update(compiled.groupindex)
+            flags = GLOBAL_FLAGS.match(pattern)
+            if flags:
+                pattern_body = f"(?{flags.group(1)}:{pattern[flags.end():]})"
+            else:
+                pattern_body = pattern
+            parts.append(f"({pattern_body})")
+            self._targets[group] = keyword
+            self.patterns.append((keyword, pattern, compiled))
+            group += compiled.groups + 1
+
+        if parts:
+            try:
+                self._regex = re.compile("|".join(parts))
+            except re.error as e:
+                print(f"合并触发模式失败，正则触发器已停用: {e}")
+                self.patterns = []
+                self._targets = {}
+
+    def match(self, message: str) -> Optional[Tuple[str, str]]:
+        """
+        从消息开头匹配触发模式
+        返回格式：(keyword, 匹配部分之后的文本) 或 None
+        """
+        if self._regex is None:
+            return None
+        matched = self._regex.match(message)
+        if matched is None:
+            return None
+        return self._targets[matched.lastindex], message[matched.end():].strip()
+
+    def __bool__(self) -> bool:
+        return self._regex is not None
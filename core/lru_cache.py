@@ -0,0 +1,128 @@
+# lru_cache.py - LRU缓存（按过期时间或按字节数限制）
+
+import time
+from collections import OrderedDict
+from typing import Any, Hashable, Iterator, Optional, Tuple
+
+
+class TTLCache:
+    """
+    容量有限的LRU缓存，每个条目可以有自己的过期时间
+
+    过期时间使用时间戳（time.time()），便于把条目持久化到文件后在重启时继续使用。
+    过期的条目在读取时惰性删除，超出容量时淘汰最久未使用的条目。
+    """
+    def __init__(self, maxsize: int = 1024, ttl: Optional[float] = None):
+        self.maxsize = maxsize
+        # 默认存活时间（秒），None表示不过期
+        self.ttl = ttl
+        self._data: "OrderedDict[Hashable, Tuple[Any, Optional[float]]]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        """
+        读取缓存，未命中或已过期时返回default
+        """
+        item = self._data.get(key)
+        if item is not None:
+            value, expires_at = item
+            if expires_at is None or expires_at > time.time():
+                self._data.move_to_end(key)
+                self.hits += 1
+                return value
+            del self._data[key]
+        self.misses += 1
+        return default
+
+    def set(self, key: Hashable, value: Any, ttl: Optional[float] = None,
+            expires_at: Optional[float] = None) -> None:
+        """
+        写入缓存，可以指定存活时间ttl或绝对过期时间expires_at，都不指定时使用默认ttl
+        """
+        if expires_at is None:
+            ttl = self.ttl if ttl is None else ttl
+            expires_at = time.time() + ttl if ttl is not None else None
+        self._data[key] = (value, expires_at)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def pop(self, key: Hashable, default: Any = None) -> Any:
+        item = self._data.pop(key, None)
+        return default if item is None else item[0]
+
+    def clear(self) -> None:
+        self._data.clear()
+
+    def items(self) -> Iterator[Tuple[Hashable, Any, Optional[float]]]:
+        """
+        遍历未过期的条目，按从旧到新的顺序返回(key, value, expires_at)
+        """
+        now = time.time()
+        for key, (value, expires_at) in list(self._data.items()):
+            if expires_at is None or expires_at > now:
+                yield key, value, expires_at
+
+    @property
+    def hit_rate(self) -> float:
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    def __contains__(self, key: Hashable) -> bool:
+        item = self._data.get(key)
+        return item is not None and (item[1] is None or item[1] > time.time())
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+
+class SizedLRUCache:
+    """
+    按总字节数限制容量的LRU缓存，适合缓存大小差异很大的值（例如图片数据）
+    """
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self.current_bytes = 0
+        self._data: "OrderedDict[Hashable, Tuple[Any, int]]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        item = self._data.get(key)
+        if item is None:
+            self.misses += 1
+            return default
+        self._data.move_to_end(key)
+        self.hits += 1
+        return item[0]
+
+    def set(self, key: Hashable, value: Any, size: int) -> None:
+        """
+        写入缓存，size为该条目占用的字节数，超过总容量的条目不缓存
+        """
+        self.pop(key)
+        if size > self.max_bytes:
+            return
+        self._data[key] = (value, size)
+        self.current_bytes += size
+        while self.current_bytes > self.max_bytes:
+            _, (_, evicted_size) = self._data.popitem(last=False)
+            self.current_bytes -= evicted_size
+
+    def pop(self, key: Hashable, default: Any = None) -> Any:
+        item = self._data.pop(key, None)
+        if item is None:
+            return default
+        self.current_bytes -= item[1]
+        return item[0]
+
+    def clear(self) -> None:
+        self._data.clear()
+        self.current_bytes = 0
+
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self._data
+
+    def __len__(self) -> int:
+        return len(self._data)
@@ -2,9 +2,12 @@
 
 from langbot_plugin.api.entities import context
 from typing import List, Dict
-import os
-import importlib.util
 from core import feature_disabler
+from core import module_loader
+from core.message_processor import escape_markup
+
+# 缓存渲染好的菜单文本，key为(模块注册表版本, 禁用列表版本)
+_menu_cache: Dict = {}
 
 # 使用get_info()函数提供模块信息
 def get_info() -> Dict[str, str]:
@@ -17,8 +20,8 @@ def get_info() -> Dict[str, str]:
     return {
         "keyword": "菜单",
         "description": "显示func目录中所有可用的功能命令，以及核心功能",
-        "usage": "菜单 [禁用/启用/禁用列表] [功能名]",
-        "example": "菜单\n菜单 禁用 功能名\n菜单 启用 功能名\n菜单 禁用列表"
+        "usage": "菜单 [禁用/启用/禁用列表] [功能名] [本群/群 群号/用户 用户ID]",
+        "example": "菜单\n菜单 禁用 功能名\n菜单 禁用 功能名 本群\n菜单 启用 功能名 用户 12345\n菜单 禁用列表"
     }
 
 async def execute(event_context: context.EventContext, request_dict: Dict) -> str:
@@ -40,119 +43,118 @@ async def execute(event_context: context.EventContext, request_dict: Dict) -> st
         # 处理禁用命令
         if args[0] == "禁用" and len(args) >= 2:
             feature_name = args[1]
-            # 检查功能是否存在
-            from core.module_loader import find_module_by_keyword
-            # 临时禁用检查，以确定功能是否存在
-            original_is_disabled = feature_disabler.is_disabled(feature_name)
-            if original_is_disabled:
-                return f"功能 '{feature_name}' 已经被禁用"
+            scope = parse_scope(args[2:], request_dict)
+            if isinstance(scope, str):
+                return scope
+            scope, target, scope_label = scope
             
-            module_tuple = find_module_by_keyword(feature_name)
-            if module_tuple:
-                # 禁用功能
-                result = feature_disabler.disable_feature(feature_name)
-                if result:
-                    return f"已成功禁用功能 '{feature_name}'"
-                else:
-                    return f"禁用功能 '{feature_name}' 失败"
-            else:
-                return f"未找到功能 '{feature_name}'"
+            # 检查功能是否存在，别名按其对应的关键词处理
+            keyword = module_loader.resolve_name(feature_name)
+            if keyword is None:
+                return f"未找到功能 '{escape_markup(feature_name)}'"
+            feature_name = keyword
+            # 禁用功能
+            if feature_disabler.disable_feature(feature_name, scope, target):
+                return f"已成功{scope_label}禁用功能 '{feature_name}'"
+            return f"功能 '{feature_name}' 已经{scope_label}被禁用"
         
         # 处理启用命令
         elif args[0] == "启用" and len(args) >= 2:
             feature_name = args[1]
-            result = feature_disabler.enable_feature(feature_name)
-            if result:
-                return f"已成功启用功能 '{feature_name}'"
-            else:
-                return f"功能 '{feature_name}' 未被禁用或不存在"
+            scope = parse_scope(args[2:], request_dict)
+            if isinstance(scope, str):
+                return scope
+            scope, target, scope_label = scope
+            
+            # 别名按其对应的关键词处理，已删除的功能仍可按原名称启用
+            feature_name = module_loader.resolve_name(feature_name) or feature_name
+            if feature_disabler.enable_feature(feature_name, scope, target):
+                return f"已成功{scope_label}启用功能 '{feature_name}'"
+            return f"功能 '{escape_markup(feature_name)}' {scope_label}未被禁用或不存在"
         
         # 处理查看禁用列表命令
         elif args[0] == "禁用列表":
-            disabled_list = feature_disabler.get_disabled_features()
-            if disabled_list:
-                return f"当前被禁用的功能：\n" + "\n".join(disabled_list)
-            else:
-                return "没有被禁用的功能"
+            return render_disabled_list()
     
-    # 获取项目根目录
-    base_dir = os.path.dirname(os.path.dirname(__file__))
+    # 菜单文本只依赖模块列表和禁用状态，两者都没有变化时直接返回缓存
+    cache_key = (module_loader.registry.version, feature_disabler.get_version())
+    if _menu_cache.get('key') != cache_key:
+        _menu_cache['text'] = render_menu()
+        _menu_cache['key'] = cache_key
+    return _menu_cache['text']
+
+
+def parse_scope(scope_args: List[str], request_dict: Dict):
+    """
+    解析禁用/启用命令的作用范围
     
-    # 获取func目录路径
-    func_dir = os.path.join(base_dir, 'func')
+    Returns:
+        (scope, target, 范围说明) 或 错误提示文本
+    """
+    if not scope_args:
+        return feature_disabler.SCOPE_GLOBAL, None, ""
+    if scope_args[0] == "本群":
+        group_id = request_dict.get('group_id')
+        if not group_id:
+            return "请在群聊中使用“本群”，或使用“群 群号”指定群"
+        return feature_disabler.SCOPE_GROUP, group_id, "在本群"
+    if scope_args[0] in ("群", "用户") and len(scope_args) >= 2:
+        if scope_args[0] == "群":
+            return feature_disabler.SCOPE_GROUP, scope_args[1], f"在群 {escape_markup(scope_args[1])} "
+        return feature_disabler.SCOPE_USER, scope_args[1], f"对用户 {escape_markup(scope_args[1])} "
+    return "作用范围格式错误，可选：本群 / 群 群号 / 用户 用户ID"
+
+
+def render_disabled_list() -> str:
+    """
+    生成全局禁用名单以及群和用户策略的文本
+    """
+    lines = []
+    disabled_list = sorted(feature_disabler.get_disabled_features())
+    if disabled_list:
+        lines.append("当前被禁用的功能：")
+        lines.extend(disabled_list)
+    for scope, label in ((feature_disabler.SCOPE_GROUP, "群"), (feature_disabler.SCOPE_USER, "用户")):
+        for target, policy in feature_disabler.get_policies(scope).items():
+            if policy.get('deny'):
+                lines.append(f"{label} {target} 禁用：{', '.join(policy['deny'])}")
+            if policy.get('allow'):
+                lines.append(f"{label} {target} 单独启用：{', '.join(policy['allow'])}")
+    if not lines:
+        return "没有被禁用的功能"
+    return "\n".join(lines)
+
+
+def render_menu() -> str:
+    """
+    根据模块注册表生成菜单文本
+    
+    Returns:
+        str: 菜单文本
+    """
+    entries = module_loader.registry.get_entries()
+    
+    def format_entry(entry) -> str:
+        description = entry.info.get('description', '无描述')
+        aliases = module_loader.get_info_list(entry.info, 'aliases')
+        name = f"{entry.keyword}({'/'.join(aliases)})" if aliases else entry.keyword
+        if feature_disabler.is_disabled(entry.keyword):
+            return f"{name}: {description} (已禁用)\n"
+        return f"{name}: {description}\n"
     
     # 获取所有功能模块
     help_text = "可用的功能命令:\n\n"
     
     # 添加核心功能模块
     help_text += "核心功能:\n"
-    core_dir = os.path.dirname(__file__)
-    for file in os.listdir(core_dir):
-        # 定义排除的文件列表，方便后续添加
-        excluded_files = ["__init__.py", "module_loader.py", 
-                        "message_processor.py", "feature_disabler.py"]   
-        if file.endswith(".py") and file not in excluded_files:
-            module_name = file[:-3]  # 去掉.py后缀
-            
-            try:
-                # 动态导入模块
-                spec = importlib.util.spec_from_file_location(module_name, os.path.join(core_dir, file))
-                module = importlib.util.module_from_spec(spec)
-                spec.loader.exec_module(module)
-                
-                # 获取模块的关键词和描述
-                if hasattr(module, 'get_info') and callable(module.get_info):
-                    try:
-                        info = module.get_info()
-                        if isinstance(info, dict):
-                            keyword = info.get('keyword', module_name)
-                            description = info.get('description', '无描述')
-                        else:
-                            keyword = module_name
-                            description = '无描述'
-                    except Exception as e:
-                        keyword = module_name
-                        description = f'获取信息失败 ({str(e)})'
-                else:
-                    keyword = module_name
-                    description = '无描述'
-                
-                help_text += f"{keyword}: {description}\n"
-            except Exception as e:
-                help_text += f"{module_name}: 加载失败 ({str(e)})\n"
+    for entry in entries:
+        if entry.module_type == "core":
+            help_text += format_entry(entry)
     
     # 添加普通功能模块
     help_text += "\n普通功能:\n"
-    if os.path.exists(func_dir):
-        for file in os.listdir(func_dir):
-            if file.endswith(".py") and file != "__init__.py":
-                module_name = file[:-3]  # 去掉.py后缀
-                
-                try:
-                    # 动态导入模块
-                    spec = importlib.util.spec_from_file_location(module_name, os.path.join(func_dir, file))
-                    module = importlib.util.module_from_spec(spec)
-                    spec.loader.exec_module(module)
-                    
-                    # 获取模块的关键词和描述
-                    if hasattr(module, 'get_info') and callable(module.get_info):
-                        try:
-                            info = module.get_info()
-                            if isinstance(info, dict):
-                                keyword = info.get('keyword', module_name)
-                                description = info.get('description', '无描述')
-                            else:
-                                keyword = module_name
-                                description = '无描述'
-                        except Exception as e:
-                            keyword = module_name
-                            description = f'获取信息失败 ({str(e)})'
-                    else:
-                        keyword = module_name
-                        description = '无描述'
-                    
-                    help_text += f"{keyword}: {description}\n"
-                except Exception as e:
-                    help_text += f"{module_name}: 加载失败 ({str(e)})\n"
+    for entry in entries:
+        if entry.module_type == "func":
+            help_text += format_entry(entry)
     help_text += "\n使用 <功能> --help 查看特定功能的使用帮助"
-    return help_text
\ No newline at end of file
+    return help_text
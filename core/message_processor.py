@@ -1,64 +1,258 @@
 import re
+import asyncio
 import base64
-from pathlib import Path
+import mmap
+import os
+from typing import Iterable, Iterator, List, Optional, Tuple
+from urllib.parse import unquote, urlparse
 from langbot_plugin.api.entities.builtin.platform import message as platform_message
+from core.lru_cache import SizedLRUCache
+
+# 插件根目录，模块返回的相对图片路径以此为基准
+PLUGIN_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+# 允许发送本地图片的目录，默认只有插件根目录，可通过set_image_dirs()追加
+image_dirs: List[str] = [os.path.realpath(PLUGIN_ROOT)]
+# 支持的本地图片格式
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.gif', '.webp')
+
+# 模块返回文本中的标记，按出现顺序一次扫描：
+#   ![说明](图片)      网络图片，或插件根目录（及配置的图片目录）下的file://、绝对路径、相对路径
+#   @{用户ID}          @指定用户
+#   <!--break-->       单独一行，把结果拆分为多条消息发送
+TOKEN_PATTERN = re.compile(
+    r'!\[[^\]\n]*\]\(\s*(?P<image>[^)\s]+)\s*\)'
+    r'|@\{(?P<at>[^}\s]+)\}'
+    r'|(?P<break>^[ \t]*<!--\s*break\s*-->[ \t]*(?:\n|$))',
+    re.MULTILINE
+)
+# 本地图片编码后的缓存总大小（字节）
+IMAGE_CACHE_BYTES = 32 * 1024 * 1024
+# 允许发送的本地图片最大大小（字节）
+MAX_IMAGE_BYTES = 10 * 1024 * 1024
+# 超过该大小的图片使用mmap读取，避免额外复制一次文件内容
+MMAP_THRESHOLD = 256 * 1024
+
+# 本地图片的base64缓存，key为(路径, mtime, 大小)，文件变化后自动失效
+image_cache = SizedLRUCache(IMAGE_CACHE_BYTES)
+
+# 需要转义的标记开头，在其中插入零宽空格后不再被识别为标记
+MARKUP_PATTERN = re.compile(r'(?<=!)(?=\[)|(?<=@)(?=\{)|(?<=<)(?=!--)')
+
+# 标记类型
+TEXT = 'text'
+IMAGE_URL = 'image_url'
+IMAGE_PATH = 'image_path'
+AT = 'at'
+BREAK = 'break'
+
+Token = Tuple[str, str]
+
+
+class ImageTooLargeError(Exception):
+    pass
+
+
+def _image_cache_key(image_path: str, stat: os.stat_result):
+    return (image_path, stat.st_mtime_ns, stat.st_size)
+
+
+def load_image_base64(image_path: str) -> str:
+    """
+    读取本地图片并返回base64编码，结果按(路径, mtime, 大小)缓存
+    """
+    stat = os.stat(image_path)
+    key = _image_cache_key(image_path, stat)
+    cached = image_cache.get(key)
+    if cached is not None:
+        return cached
+    if stat.st_size > MAX_IMAGE_BYTES:
+        raise ImageTooLargeError(f"{stat.st_size} bytes > {MAX_IMAGE_BYTES} bytes")
+
+    with open(image_path, 'rb') as img_file:
+        if stat.st_size >= MMAP_THRESHOLD:
+            with mmap.mmap(img_file.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                img_base64 = base64.b64encode(mapped).decode('utf-8')
+        else:
+            img_base64 = base64.b64encode(img_file.read()).decode('utf-8')
+    image_cache.set(key, img_base64, len(img_base64))
+    return img_base64
+
+
+def get_cached_image_base64(image_path: str) -> Optional[str]:
+    """
+    只查询缓存，文件不存在或未缓存时返回None
+    """
+    try:
+        stat = os.stat(image_path)
+    except OSError:
+        return None
+    return image_cache.get(_image_cache_key(image_path, stat))
+
+
+def set_image_dirs(dirs: Iterable[str]) -> None:
+    """
+    设置插件根目录之外允许发送本地图片的目录
+    """
+    global image_dirs
+    image_dirs = [os.path.realpath(PLUGIN_ROOT)]
+    image_dirs.extend(os.path.realpath(os.path.expanduser(path)) for path in dirs if path)
+
+
+def is_allowed_image_path(path: str) -> bool:
+    """
+    判断本地路径（解析符号链接后）是否位于允许的图片目录中
+    """
+    path = os.path.realpath(path)
+    return any(os.path.commonpath([root, path]) == root for root in image_dirs)
+
+
+def escape_markup(text: str) -> str:
+    """
+    转义文本中的图片、@和分段标记，用于把用户输入原样放进返回结果
+    """
+    return MARKUP_PATTERN.sub('\u200b', text)
+
+
+def resolve_image(target: str) -> Optional[Token]:
+    """
+    解析图片地址，返回(IMAGE_URL, 地址)或(IMAGE_PATH, 绝对路径)
+    不支持的地址（未知协议、非图片后缀、不在允许的图片目录中的路径）返回None
+    """
+    if target.startswith(('http://', 'https://')):
+        return IMAGE_URL, target
+    if target.startswith('file://'):
+        path = unquote(urlparse(target).path)
+    elif os.path.isabs(target):
+        path = target
+    elif '://' in target:
+        return None
+    else:
+        path = os.path.join(PLUGIN_ROOT, target)
+    path = os.path.normpath(path)
+    if not path.lower().endswith(IMAGE_EXTENSIONS) or not is_allowed_image_path(path):
+        return None
+    return IMAGE_PATH, path
+
+
+def tokenize(message: str) -> Iterator[Token]:
+    """
+    单次扫描模块返回的文本，按顺序产生(类型, 值)标记
+    普通文本只在标记之间切片一次，整体耗时与文本长度成线性关系
+    """
+    last_end = 0
+    for match in TOKEN_PATTERN.finditer(message):
+        kind = match.lastgroup
+        if kind == 'image':
+            token = resolve_image(match.group('image'))
+            if token is None:
+                # 无法识别的图片地址按原文输出
+                continue
+        elif kind == 'at':
+            token = (AT, match.group('at'))
+        else:
+            token = (BREAK, '')
+
+        start, end = match.span()
+        if start > last_end:
+            yield TEXT, message[last_end:start]
+        yield token
+        last_end = end
+    if last_end < len(message):
+        yield TEXT, message[last_end:]
+
+
+async def preload_images(message: str) -> None:
+    """
+    在线程中读取消息里尚未缓存的本地图片，避免文件读取和编码阻塞事件循环
+    """
+    paths: List[str] = []
+    for kind, value in tokenize(message):
+        if kind == IMAGE_PATH and value not in paths and get_cached_image_base64(value) is None:
+            paths.append(value)
+    for image_path in paths:
+        try:
+            await asyncio.to_thread(load_image_base64, image_path)
+        except Exception:
+            # 错误留到转换消息时再提示
+            pass
+
+
+def _image_component(image_path: str):
+    if not os.path.isfile(image_path):
+        return platform_message.Plain(text=f"[Image not found: {image_path}]")
+    try:
+        return platform_message.Image(base64=load_image_base64(image_path))
+    except ImageTooLargeError as e:
+        return platform_message.Plain(text=f"[Image too large: {e}]")
+    except Exception as e:
+        return platform_message.Plain(text=f"[Error loading image: {e}]")
 
 
 class MessageProcessor:
     @staticmethod
-    def convert_message(message, sender_id, need_at=False):
+    def split_messages(message, sender_id, need_at=False):
         """
-        将消息文本转换为消息链对象，支持解析文本、网络图片和本地路径图片
+        将消息文本转换为一条或多条消息的组件列表
+        支持文本、网络图片、本地图片、@用户，以及用<!--break-->拆分消息
+        need_at为True时只在第一条消息开头@发送者
         """
+        messages = []
         parts = []
-        last_end = 0
-        has_image = False
-        
-        # 组合所有图片模式
-        image_pattern = re.compile(
-            r'!\[.*?\]\(\s*((?:https?://\S+)|(?:/home/.*?\.png))\s*\)'  # 网络图片或本地图片
-        )
         
         # 处理@功能
         if need_at:
             parts.append(platform_message.At(target=sender_id))
         
-        # 统一处理所有图片
-        for match in image_pattern.finditer(message):
-            has_image = True
-            start, end = match.span()
-            
-            # 添加图片前的文本
-            if start > last_end:
-                parts.append(platform_message.Plain(text=message[last_end:start]))
-            
-            # 处理图片
-            image_url_or_path = match.group(1)
-            
-            if image_url_or_path.startswith(('http://', 'https://')):
+        for kind, value in tokenize(message):
+            if kind == TEXT:
+                parts.append(platform_message.Plain(text=value))
+            elif kind == IMAGE_URL:
                 # 网络图片
-                parts.append(platform_message.Image(url=image_url_or_path))
-            else:
+                parts.append(platform_message.Image(url=value))
+            elif kind == IMAGE_PATH:
                 # 本地图片
-                image_path = Path(image_url_or_path)
-                if image_path.exists():
-                    try:
-                        with open(image_path, 'rb') as img_file:
-                            img_bytes = img_file.read()
-                            img_base64 = base64.b64encode(img_bytes).decode('utf-8')
-                        parts.append(platform_message.Image(base64=img_base64))
-                    except Exception as e:
-                        parts.append(platform_message.Plain(text=f"[Error loading image: {e}]"))
-                else:
-                    parts.append(platform_message.Plain(text=f"[Image not found: {image_url_or_path}]"))
-            
-            last_end = end
-        
-        # 添加剩余文本
-        if last_end < len(message):
-            parts.append(platform_message.Plain(text=message[last_end:]))
-        elif not has_image:
-            # 如果没有找到任何图片，添加原始消息
-            parts.append(platform_message.Plain(text=message))
+                parts.append(_image_component(value))
+            elif kind == AT:
+                parts.append(platform_message.At(target=value))
+            else:
+                # 去掉分隔行前的换行，空消息不发送
+                if parts and isinstance(parts[-1], platform_message.Plain):
+                    parts[-1] = platform_message.Plain(text=parts[-1].text.rstrip('\n'))
+                    if not parts[-1].text:
+                        parts.pop()
+                if parts:
+                    messages.append(parts)
+                parts = []
         
-        return parts if parts else [platform_message.Plain(text=message)]
\ No newline at end of file
+        if parts or not messages:
+            messages.append(parts if parts else [platform_message.Plain(text=message)])
+        return messages
+
+    @staticmethod
+    def convert_message(message, sender_id, need_at=False):
+        """
+        将消息文本转换为消息链对象，支持解析文本、网络图片和本地路径图片
+        有多条消息时合并为一条，分隔处用换行代替
+        """
+        parts = []
+        for index, message_parts in enumerate(MessageProcessor.split_messages(message, sender_id, need_at)):
+            if index:
+                parts.append(platform_message.Plain(text='\n'))
+            parts.extend(message_parts)
+        return parts
+
+    @staticmethod
+    async def convert_message_async(message, sender_id, need_at=False):
+        """
+        与convert_message相同，但会先在线程中读取未缓存的本地图片
+        """
+        await preload_images(message)
+        return MessageProcessor.convert_message(message, sender_id, need_at)
+
+    @staticmethod
+    async def split_messages_async(message, sender_id, need_at=False):
+        """
+        与split_messages相同，但会先在线程中读取未缓存的本地图片
+        """
+        await preload_images(message)
+        return MessageProcessor.split_messages(message, sender_id, need_at)
@@ -0,0 +1,241 @@
+# metrics.py - 消息处理流程的耗时统计与OpenMetrics导出
+
+import asyncio
+import bisect
+import os
+import time
+from typing import Callable, Dict, List, Optional, Tuple
+
+# 耗时直方图的桶上限（秒）
+DEFAULT_BUCKETS = (0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+CONTENT_TYPE = "application/openmetrics-text; version=1.0.0; charset=utf-8"
+
+LabelKey = Tuple[Tuple[str, str], ...]
+
+
+def _label_key(labels: Dict[str, str]) -> LabelKey:
+    # 指标在每条消息上都会记录多次，单个标签时跳过排序
+    if len(labels) <= 1:
+        return tuple(labels.items())
+    return tuple(sorted(labels.items()))
+
+
+def _format_labels(label_key: LabelKey, extra: str = "") -> str:
+    parts = []
+    for name, value in label_key:
+        value = str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+        parts.append(f'{name}="{value}"')
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _format_value(value: float) -> str:
+    if isinstance(value, int) or float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class Histogram:
+    """
+    固定桶的直方图
+    """
+    def __init__(self, buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value: float) -> None:
+        index = bisect.bisect_left(self.buckets, value)
+        if index < len(self.counts):
+            self.counts[index] += 1
+        self.count += 1
+        self.sum += value
+
+
+class Metrics:
+    """
+    进程内的指标集合，包含计数器、直方图和在导出时计算的指标值
+    """
+    def __init__(self, prefix: str = "langbotbox"):
+        self.prefix = prefix
+        self._counters: Dict[str, Dict[LabelKey, float]] = {}
+        self._histograms: Dict[str, Dict[LabelKey, Histogram]] = {}
+        self._gauges: Dict[str, Callable[[], float]] = {}
+        self._help: Dict[str, str] = {}
+
+    def describe(self, name: str, help_text: str) -> None:
+        self._help[name] = help_text
+
+    def inc(self, name: str, amount: float = 1, **labels) -> None:
+        series = self._counters.get(name)
+        if series is None:
+            series = self._counters[name] = {}
+        key = _label_key(labels)
+        series[key] = series.get(key, 0) + amount
+
+    def histogram(self, name: str, **labels) -> Histogram:
+        """
+        返回指定标签的直方图，热点路径上可以预先取出后直接调用observe
+        """
+        series = self._histograms.get(name)
+        if series is None:
+            series = self._histograms[name] = {}
+        key = _label_key(labels)
+        histogram = series.get(key)
+        if histogram is None:
+            histogram = series[key] = Histogram()
+        return histogram
+
+    def observe(self, name: str, value: float, **labels) -> None:
+        self.histogram(name, **labels).observe(value)
+
+    def gauge(self, name: str, func: Callable[[], float]) -> None:
+        """
+        注册一个在导出时才计算的指标，例如缓存命中率
+        """
+        self._gauges[name] = func
+
+    def get_counter(self, name: str, **labels) -> float:
+        return self._counters.get(name, {}).get(_label_key(labels), 0)
+
+    def render(self) -> str:
+        """
+        以OpenMetrics文本格式导出所有指标
+        """
+        lines: List[str] = []
+        for name, series in self._counters.items():
+            family = f"{self.prefix}_{name}"
+            self._render_header(lines, family, name, "counter")
+            for key, value in series.items():
+                lines.append(f"{family}_total{_format_labels(key)} {_format_value(value)}")
+        for name, series in self._histograms.items():
+            family = f"{self.prefix}_{name}"
+            self._render_header(lines, family, name, "histogram")
+            for key, histogram in series.items():
+                cumulative = 0
+                for bound, count in zip(histogram.buckets, histogram.counts):
+                    cumulative += count
+                    le = 'le="%s"' % bound
+                    lines.append(f"{family}_bucket{_format_labels(key, le)} {cumulative}")
+                le = 'le="+Inf"'
+                lines.append(f"{family}_bucket{_format_labels(key, le)} {histogram.count}")
+                lines.append(f"{family}_count{_format_labels(key)} {histogram.count}")
+                lines.append(f"{family}_sum{_format_labels(key)} {_format_value(histogram.sum)}")
+        for name, func in self._gauges.items():
+            family = f"{self.prefix}_{name}"
+            try:
+                value = func()
+            except Exception as e:
+                print(f"计算指标 {name} 失败: {e}")
+                continue
+            self._render_header(lines, family, name, "gauge")
+            lines.append(f"{family} {_format_value(value)}")
+        lines.append("# EOF")
+        return "\n".join(lines) + "\n"
+
+    def _render_header(self, lines: List[str], family: str, name: str, metric_type: str) -> None:
+        lines.append(f"# TYPE {family} {metric_type}")
+        if name in self._help:
+            lines.append(f"# HELP {family} {self._help[name]}")
+
+
+class MetricsExporter:
+    """
+    导出指标：在本地端口提供HTTP接口，和/或定期写入文件
+    """
+    def __init__(self, metrics: Metrics, port: Optional[int] = None, file: Optional[str] = None,
+                 interval: float = 15.0, host: str = "127.0.0.1"):
+        self.metrics = metrics
+        self.port = port
+        self.file = file
+        self.interval = interval
+        self.host = host
+        self._server: Optional[asyncio.AbstractServer] = None
+        self._write_task: Optional[asyncio.Task] = None
+
+    async def start(self) -> None:
+        if self.port:
+            try:
+                self._server = await asyncio.start_server(self._handle_client, self.host, self.port)
+            except OSError as e:
+                print(f"指标接口启动失败 {self.host}:{self.port}: {e}")
+        if self.file:
+            self._write_task = asyncio.get_running_loop().create_task(self._write_periodically())
+
+    async def stop(self) -> None:
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+        if self._write_task is not None:
+            self._write_task.cancel()
+            self._write_task = None
+
+    async def _handle_client(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        try:
+            # 只需要读完请求头，不区分路径
+            await asyncio.wait_for(reader.readuntil(b"\r\n\r\n"), timeout=5)
+            body = self.metrics.render().encode("utf-8")
+            writer.write(
+                b"HTTP/1.1 200 OK\r\n"
+                + f"Content-Type: {CONTENT_TYPE}\r\n".encode("utf-8")
+                + f"Content-Length: {len(body)}\r\nConnection: close\r\n\r\n".encode("utf-8")
+                + body
+            )
+            await writer.drain()
+        except (asyncio.TimeoutError, asyncio.IncompleteReadError, asyncio.LimitOverrunError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    def write_file(self, text: str) -> None:
+        """
+        写入指标文件，先写临时文件再替换，读取方不会读到写了一半的内容
+        """
+        tmp_file = self.file + ".tmp"
+        with open(tmp_file, "w", encoding="utf-8") as f:
+            f.write(text)
+        os.replace(tmp_file, self.file)
+
+    async def _write_periodically(self) -> None:
+        while True:
+            try:
+                # 在事件循环中生成文本，只把文件写入放到线程中
+                await asyncio.to_thread(self.write_file, self.metrics.render())
+            except Exception as e:
+                print(f"写入指标文件失败: {e}")
+            await asyncio.sleep(self.interval)
+
+
+# 创建全局实例
+metrics = Metrics()
+metrics.describe("stage_seconds", "Time spent in each message pipeline stage")
+metrics.describe("command_seconds", "Time from keyword match to reply per command keyword")
+metrics.describe("messages", "Messages received by the listener")
+metrics.describe("errors", "Errors raised in the message pipeline")
+metrics.describe("expired_queries", "Replies dropped because the query id had expired")
+metrics.describe("execute_seconds", "Time spent in module execute per command keyword")
+metrics.describe("disabled_hits", "Messages that hit a disabled feature")
+metrics.describe("rate_limited", "Commands rejected by the rate limiter")
+metrics.describe("timeouts", "Module executions cancelled after exceeding their deadline")
+metrics.describe("busy_rejections", "Commands rejected because the scheduler queue was full")
+metrics.describe("import_seconds", "Time spent importing a module on first use")
+
+
+# 提供便捷函数
+def inc(name: str, amount: float = 1, **labels) -> None:
+    metrics.inc(name, amount, **labels)
+
+def observe(name: str, value: float, **labels) -> None:
+    metrics.observe(name, value, **labels)
+
+def histogram(name: str, **labels) -> Histogram:
+    return metrics.histogram(name, **labels)
+
+def gauge(name: str, func: Callable[[], float]) -> None:
+    metrics.gauge(name, func)
+
+def render() -> str:
+    return metrics.render()
@@ -1,10 +1,16 @@
 # module_loader.py - 模块加载器
 
+import ast
+import json
 import os
 import importlib.util
 import sys
+import time
+import types
 from typing import List, Dict, Tuple, Optional, Any
 from core import feature_disabler
+from core import metrics
+from core.keyword_matcher import KeywordMatcher, PatternMatcher
 
 
 def get_base_dir() -> str:
@@ -47,62 +53,740 @@ def get_module_description(module) -> str:
     return "无描述"
 
 
+# 注册表导入的模块在sys.modules中的命名空间，例如 langbotbox.func.weather
+MODULE_NAMESPACE = 'langbotbox'
+
+
+def get_module_name(module_file: str, module_type: str) -> str:
+    """
+    模块在sys.modules中的名称，同一文件始终对应同一个名称
+    """
+    return f"{MODULE_NAMESPACE}.{module_type}.{os.path.basename(module_file)[:-3]}"
+
+
+def get_file_version(module_file: str) -> Optional[Tuple[int, int]]:
+    """
+    文件的(mtime, 大小)，用于判断已导入的模块是否过期
+    """
+    try:
+        stat = os.stat(module_file)
+    except OSError:
+        return None
+    return stat.st_mtime_ns, stat.st_size
+
+
+def _ensure_namespace(module_name: str) -> None:
+    """
+    为命名空间中的上级包创建占位模块，使 langbotbox.func.xxx 这样的名称可以正常解析
+    """
+    parts = module_name.split('.')
+    for index in range(1, len(parts)):
+        package_name = '.'.join(parts[:index])
+        if package_name not in sys.modules:
+            package = types.ModuleType(package_name)
+            package.__path__ = []
+            sys.modules[package_name] = package
+
+
+# 注册表快照的格式版本，格式变化时旧快照自动失效
+SNAPSHOT_FORMAT = 1
+
+
+# read_static_info()的返回值：文件中没有定义get_info
+NO_GET_INFO = object()
+# read_static_info()的返回值：get_info的返回值不是字面量，需要导入模块才能获取
+DYNAMIC_INFO = object()
+
+
+# 会阻塞事件循环的调用，前缀以"."结尾时匹配该模块下的所有调用
+BLOCKING_CALLS = (
+    'requests.',
+    'urllib.request.urlopen',
+    'time.sleep',
+    'subprocess.',
+    'os.system',
+    'httpx.get', 'httpx.post', 'httpx.put', 'httpx.delete', 'httpx.request', 'httpx.Client',
+    'open',
+)
+
+
+def parse_module_file(module_file: str) -> ast.Module:
+    with open(module_file, 'r', encoding='utf-8') as f:
+        return ast.parse(f.read(), filename=module_file)
+
+
+def read_static_info(module_file: str, tree: ast.Module = None) -> Any:
+    """
+    不执行模块，通过解析语法树读取get_info()的返回值
+
+    支持get_info()直接返回字典字面量，或返回模块顶层用字面量赋值的变量。
+    返回：字典 / NO_GET_INFO / DYNAMIC_INFO
+    语法错误等无法解析的情况直接抛出异常
+    """
+    if tree is None:
+        tree = parse_module_file(module_file)
+
+    get_info_node = None
+    literals: Dict[str, ast.expr] = {}
+    for node in tree.body:
+        if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef)) and node.name == 'get_info':
+            get_info_node = node
+        elif isinstance(node, ast.Assign):
+            for target in node.targets:
+                if isinstance(target, ast.Name):
+                    if target.id == 'get_info':
+                        return DYNAMIC_INFO
+                    literals[target.id] = node.value
+        elif isinstance(node, (ast.Import, ast.ImportFrom)):
+            for alias in node.names:
+                # 通过导入得到get_info，或者 from xxx import *
+                if alias.name == '*' or (alias.asname or alias.name) == 'get_info':
+                    return DYNAMIC_INFO
+
+    if get_info_node is None:
+        return NO_GET_INFO
+    if isinstance(get_info_node, ast.AsyncFunctionDef) or get_info_node.decorator_list:
+        return DYNAMIC_INFO
+
+    body = get_info_node.body
+    # 跳过文档字符串
+    if body and isinstance(body[0], ast.Expr) and isinstance(body[0].value, ast.Constant):
+        body = body[1:]
+    if len(body) != 1 or not isinstance(body[0], ast.Return) or body[0].value is None:
+        return DYNAMIC_INFO
+
+    value = body[0].value
+    if isinstance(value, ast.Name) and value.id in literals:
+        value = literals[value.id]
+    try:
+        info = ast.literal_eval(value)
+    except ValueError:
+        return DYNAMIC_INFO
+    return info if isinstance(info, dict) else {}
+
+
+def _qualified_name(node: ast.expr, aliases: Dict[str, str]) -> Optional[str]:
+    """
+    把调用目标还原为导入时的完整名称，例如 from time import sleep 后的 sleep -> time.sleep
+    """
+    attrs = []
+    while isinstance(node, ast.Attribute):
+        attrs.append(node.attr)
+        node = node.value
+    if not isinstance(node, ast.Name):
+        return None
+    base = aliases.get(node.id, node.id)
+    return '.'.join([base] + attrs[::-1])
+
+
+def find_blocking_calls(tree: ast.Module) -> List[str]:
+    """
+    在execute及其直接或间接调用的模块内函数中查找阻塞调用（BLOCKING_CALLS）
+    只作为参数传递的函数（例如传给asyncio.to_thread）不会被计入
+    """
+    aliases: Dict[str, str] = {}
+    functions: Dict[str, ast.AST] = {}
+    for node in tree.body:
+        if isinstance(node, ast.Import):
+            for alias in node.names:
+                if alias.asname:
+                    aliases[alias.asname] = alias.name
+        elif isinstance(node, ast.ImportFrom) and node.module:
+            for alias in node.names:
+                aliases[alias.asname or alias.name] = f"{node.module}.{alias.name}"
+        elif isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef)):
+            functions[node.name] = node
+
+    found: List[str] = []
+    pending = ['execute']
+    visited = set()
+    while pending:
+        name = pending.pop()
+        if name in visited or name not in functions:
+            continue
+        visited.add(name)
+        for node in ast.walk(functions[name]):
+            if not isinstance(node, ast.Call):
+                continue
+            if isinstance(node.func, ast.Name) and node.func.id in functions:
+                pending.append(node.func.id)
+                continue
+            call = _qualified_name(node.func, aliases)
+            if call is None:
+                continue
+            for blocking in BLOCKING_CALLS:
+                if call == blocking or (blocking.endswith('.') and call.startswith(blocking)):
+                    if call not in found:
+                        found.append(call)
+                    break
+    return found
+
+
+def import_module_file(module_file: str, module_name: str = None, register: bool = False):
+    """
+    执行模块文件并返回模块对象，失败时返回None
+    register为True时把模块登记到sys.modules[module_name]（替换同名的旧模块），
+    并在模块上记录导入时文件的版本；导入失败时保留原来的模块
+    """
+    if module_name is None:
+        module_name = os.path.basename(module_file)[:-3]
+    previous = sys.modules.get(module_name) if register else None
+    try:
+        spec = importlib.util.spec_from_file_location(module_name, module_file)
+        module = importlib.util.module_from_spec(spec)
+        module.__langbotbox_version__ = get_file_version(module_file)
+        if register:
+            _ensure_namespace(module_name)
+            # 先登记再执行，模块中的dataclass、pickle等依赖sys.modules的功能才能正常工作
+            sys.modules[module_name] = module
+        spec.loader.exec_module(module)
+        return module
+    except Exception as e:
+        if register:
+            if previous is not None:
+                sys.modules[module_name] = previous
+            else:
+                sys.modules.pop(module_name, None)
+        print(f"Error loading module {module_file}: {e}")
+        return None
+
+
+def get_info_list(info: Dict[str, Any], key: str) -> List[str]:
+    """
+    读取get_info()中的列表字段（例如aliases、patterns），允许只写一个字符串
+    """
+    value = info.get(key)
+    if not value:
+        return []
+    if isinstance(value, str):
+        return [value]
+    return [item for item in value if isinstance(item, str) and item]
+
+
+class ModuleEntry:
+    """
+    注册表中的一个模块条目
+    保存模块对象、get_info()返回的信息以及模块类型(core/func)
+    get_info()为字面量的模块在扫描时不会被导入，module在第一次使用时才加载
+    """
+    def __init__(self, keyword: str, module_file: str, module_type: str, module, info: Dict[str, Any],
+                 has_keyword: bool):
+        self.keyword = keyword
+        self.module_file = module_file
+        self.module_type = module_type
+        self.module = module
+        self.info = info
+        # 模块在sys.modules中的名称
+        self.module_name = get_module_name(module_file, module_type)
+        # 读取模块信息时文件的(mtime, 大小)
+        self.file_version = get_file_version(module_file)
+        # get_info()中是否显式声明了keyword（未声明时使用文件名作为关键词，但不参与消息匹配）
+        self.has_keyword = has_keyword
+        # 导入失败后不再重复尝试，直到文件变化被重新加载
+        self.load_failed = False
+        # execute中检测到的阻塞调用
+        self.blocking_calls: List[str] = []
+        # 最近一次导入的耗时（秒）和最近一次使用的时间（time.monotonic()）
+        self.import_seconds: Optional[float] = None
+        self.last_used = time.monotonic()
+
+    @property
+    def blocking(self) -> bool:
+        """
+        是否需要在线程池中执行，get_info()中的blocking优先于自动检测的结果
+        """
+        return bool(self.info.get('blocking', bool(self.blocking_calls)))
+
+    def load(self):
+        """
+        返回模块对象，尚未导入时导入，并记录导入耗时和使用时间
+        """
+        self.last_used = time.monotonic()
+        if self.module is None and not self.load_failed:
+            started = time.perf_counter()
+            self.module = import_module_file(self.module_file, self.module_name, register=True)
+            self.import_seconds = time.perf_counter() - started
+            self.load_failed = self.module is None
+            metrics.observe('import_seconds', self.import_seconds, keyword=self.keyword)
+        return self.module
+
+    def unload(self) -> None:
+        """
+        释放模块对象，下次使用时重新导入
+        """
+        module, self.module = self.module, None
+        if module is not None and sys.modules.get(module.__name__) is module:
+            del sys.modules[module.__name__]
+
+    def summary(self) -> Dict[str, Any]:
+        """
+        返回get_module_info()格式的模块信息
+        """
+        extra_info = self.info.copy()
+        extra_info.pop('keyword', None)
+        extra_info.pop('description', None)
+        if self.blocking:
+            extra_info['blocking'] = True
+        return {
+            "description": self.info.get('description', "无描述"),
+            "type": self.module_type,
+            **extra_info
+        }
+
+
+class ModuleRegistry:
+    """
+    模块注册表
+    只在首次使用（或显式刷新）时扫描一次core和func目录并执行各模块，
+    之后的关键词、模块信息和模块对象查询都直接读取内存中的索引
+    """
+    def __init__(self, module_dirs: List[Tuple[str, str]] = None, snapshot_file: str = None):
+        """
+        Args:
+            module_dirs: 模块目录列表 [(module_dir, module_type), ...]，默认为项目中的core和func目录
+            snapshot_file: 注册表快照文件，为None时不使用快照
+        """
+        if module_dirs is None:
+            base_dir = get_base_dir()
+            module_dirs = [(os.path.join(base_dir, module_type), module_type) for module_type in ("core", "func")]
+        self._module_dirs = [(os.path.abspath(module_dir), module_type) for module_dir, module_type in module_dirs]
+        self._entries: Dict[str, ModuleEntry] = {}
+        # 每个模块文件的条目，包括因关键词重复而未注册的，key为模块文件
+        self._file_entries: Dict[str, ModuleEntry] = {}
+        self._keywords: List[str] = []
+        self._module_info: Dict[str, Dict[str, Any]] = {}
+        self._matcher = KeywordMatcher()
+        self._pattern_matcher = PatternMatcher()
+        # 按首词查找时使用的关键词和别名，值为对应的关键词
+        self._names: Dict[str, str] = {}
+        # 所有可能触发命令的首字符，不在其中的消息直接判定为闲聊
+        self._first_chars: frozenset = frozenset()
+        self._loaded = False
+        self.snapshot_file = snapshot_file
+        # 每个模块文件的快照记录，key为模块文件
+        self._records: Dict[str, Dict[str, Any]] = {}
+        # 被快速判定为非命令的消息数
+        self.rejected = 0
+        # 每次索引变化时递增，供依赖模块列表的缓存判断是否失效
+        self.version = 0
+
+    def get_module_dirs(self) -> List[Tuple[str, str]]:
+        """
+        返回模块目录，core目录优先
+        返回格式：[(module_dir, module_type), ...]
+        """
+        return self._module_dirs
+
+    def get_module_type(self, module_file: str) -> Optional[str]:
+        """
+        判断文件是否为候选模块文件，是则返回模块类型(core/func)，否则返回None
+        """
+        file = os.path.basename(module_file)
+        if not file.endswith(".py") or file == "__init__.py":
+            return None
+        module_dir = os.path.dirname(os.path.abspath(module_file))
+        for candidate_dir, module_type in self._module_dirs:
+            if module_dir == candidate_dir:
+                # 跳过module_loader.py自身
+                if module_type == "core" and file == "module_loader.py":
+                    return None
+                return module_type
+        return None
+
+    def _iter_module_files(self) -> List[Tuple[str, str]]:
+        """
+        列出所有候选模块文件，core目录优先，同一目录中按文件名排序
+        返回格式：[(module_file, module_type), ...]
+        """
+        module_files = []
+        for module_dir, module_type in self.get_module_dirs():
+            if not os.path.exists(module_dir):
+                continue
+            for file in sorted(os.listdir(module_dir)):
+                module_file = os.path.join(module_dir, file)
+                if self.get_module_type(module_file) is not None:
+                    module_files.append((module_file, module_type))
+        return module_files
+
+    def _load_entry(self, module_file: str, module_type: str) -> Tuple[Optional[ModuleEntry], bool]:
+        """
+        读取模块信息并生成注册表条目，未实现get_info()的模块返回None
+        get_info()返回字面量时只解析语法树，不导入模块；否则退回到导入模块后调用get_info()
+        返回格式：(entry, 结果是否可以写入快照)，只有不依赖导入模块的结果才能写入快照
+        """
+        module_name = os.path.basename(module_file)[:-3]
+        try:
+            tree = parse_module_file(module_file)
+            info = read_static_info(module_file, tree)
+        except Exception as e:
+            print(f"Error loading module {module_file}: {e}")
+            return None, False
+
+        if info is NO_GET_INFO:
+            return None, True
+
+        module = None
+        static_info = info is not DYNAMIC_INFO
+        if not static_info:
+            module = import_module_file(module_file, get_module_name(module_file, module_type), register=True)
+            if module is None:
+                return None, False
+            if not (hasattr(module, 'get_info') and callable(module.get_info)):
+                return None, False
+            try:
+                info = module.get_info()
+            except Exception as e:
+                print(f"Error calling get_info(): {e}")
+                info = {}
+            if not isinstance(info, dict):
+                info = {}
+
+        keyword = info.get('keyword')
+        entry = ModuleEntry(
+            keyword=keyword or module_name,
+            module_file=module_file,
+            module_type=module_type,
+            module=module,
+            info=info,
+            has_keyword=bool(keyword),
+        )
+        entry.blocking_calls = find_blocking_calls(tree)
+        if entry.blocking_calls and 'blocking' not in info:
+            print(f"模块 {entry.keyword} 中检测到阻塞调用 {', '.join(entry.blocking_calls)}，将在线程池中执行")
+        return entry, static_info
+
+    def _make_record(self, module_file: str, module_type: str, entry: Optional[ModuleEntry],
+                     version: Optional[Tuple[int, int]]) -> Optional[Dict[str, Any]]:
+        """
+        生成模块文件的快照记录，get_info()的返回值无法用JSON原样保存时返回None
+        """
+        if version is None:
+            return None
+        record: Dict[str, Any] = {"type": module_type, "version": list(version), "entry": None}
+        if entry is not None:
+            data = {
+                "keyword": entry.keyword,
+                "info": entry.info,
+                "has_keyword": entry.has_keyword,
+                "blocking_calls": entry.blocking_calls,
+            }
+            try:
+                if json.loads(json.dumps(data, ensure_ascii=False)) != data:
+                    return None
+            except (TypeError, ValueError):
+                return None
+            record["entry"] = data
+        return record
+
+    def _entry_from_record(self, module_file: str, module_type: str,
+                           record: Dict[str, Any]) -> Optional[ModuleEntry]:
+        data = record["entry"]
+        if data is None:
+            return None
+        entry = ModuleEntry(
+            keyword=data["keyword"],
+            module_file=module_file,
+            module_type=module_type,
+            module=None,
+            info=data["info"],
+            has_keyword=data["has_keyword"],
+        )
+        entry.blocking_calls = data["blocking_calls"]
+        return entry
+
+    def _read_snapshot(self) -> Dict[str, Dict[str, Any]]:
+        """
+        读取快照中各模块文件的记录，快照不存在、损坏或与当前模块目录不一致时返回空字典
+        """
+        if not self.snapshot_file:
+            return {}
+        try:
+            with open(self.snapshot_file, 'r', encoding='utf-8') as f:
+                snapshot = json.load(f)
+        except FileNotFoundError:
+            return {}
+        except Exception as e:
+            print(f"读取模块索引快照失败: {e}")
+            return {}
+        if (not isinstance(snapshot, dict) or snapshot.get("format") != SNAPSHOT_FORMAT
+                or snapshot.get("module_dirs") != [list(item) for item in self._module_dirs]):
+            return {}
+        files = snapshot.get("files")
+        return files if isinstance(files, dict) else {}
+
+    def _write_snapshot(self) -> None:
+        """
+        保存快照，先写临时文件再替换
+        """
+        if not self.snapshot_file:
+            return
+        snapshot = {
+            "format": SNAPSHOT_FORMAT,
+            "module_dirs": [list(item) for item in self._module_dirs],
+            "files": self._records,
+        }
+        try:
+            os.makedirs(os.path.dirname(self.snapshot_file), exist_ok=True)
+            tmp_file = f"{self.snapshot_file}.{os.getpid()}.tmp"
+            with open(tmp_file, 'w', encoding='utf-8') as f:
+                json.dump(snapshot, f, ensure_ascii=False, separators=(',', ':'))
+            os.replace(tmp_file, self.snapshot_file)
+        except Exception as e:
+            print(f"保存模块索引快照失败: {e}")
+
+    def scan(self) -> None:
+        """
+        重新扫描全部模块并整体替换索引
+        文件的(mtime, 大小)与快照一致时直接使用快照中的信息，只重新解析发生变化的文件
+        """
+        snapshot = self._read_snapshot()
+        records: Dict[str, Dict[str, Any]] = {}
+        file_entries: Dict[str, ModuleEntry] = {}
+        for module_file, module_type in self._iter_module_files():
+            version = get_file_version(module_file)
+            record = snapshot.get(module_file)
+            if (record is not None and version is not None and record.get("type") == module_type
+                    and record.get("version") == list(version)):
+                entry = self._entry_from_record(module_file, module_type, record)
+            else:
+                entry, cacheable = self._load_entry(module_file, module_type)
+                record = self._make_record(module_file, module_type, entry, version) if cacheable else None
+            if record is not None:
+                records[module_file] = record
+            if entry is not None:
+                file_entries[module_file] = entry
+        self._replace_entries(self._resolve_entries(file_entries))
+        self._file_entries = file_entries
+        self._loaded = True
+        if records != snapshot:
+            self._records = records
+            self._write_snapshot()
+        else:
+            self._records = snapshot
+
+    def reload_files(self, module_files: List[str]) -> None:
+        """
+        增量重新加载发生变化（修改、新增或删除）的模块文件
+        新条目全部准备好后才整体替换索引，正在处理的消息继续使用旧的模块对象
+        """
+        self.ensure_loaded()
+        changed = {os.path.abspath(module_file) for module_file in module_files
+                   if self.get_module_type(module_file) is not None}
+        if not changed:
+            return
+
+        # 先移除这些文件原有的条目
+        file_entries = {module_file: entry for module_file, entry in self._file_entries.items()
+                        if module_file not in changed}
+
+        records = {module_file: record for module_file, record in self._records.items()
+                   if module_file not in changed}
+        for module_file in sorted(changed):
+            if not os.path.exists(module_file):
+                print(f"模块文件已删除: {module_file}")
+                continue
+            module_type = self.get_module_type(module_file)
+            version = get_file_version(module_file)
+            entry, cacheable = self._load_entry(module_file, module_type)
+            record = self._make_record(module_file, module_type, entry, version) if cacheable else None
+            if record is not None:
+                records[module_file] = record
+            if entry is not None:
+                file_entries[module_file] = entry
+
+        # 所有文件的条目重新决定关键词归属，原先因重复被忽略的文件可以接替被删除或改名的模块
+        entries = self._resolve_entries(file_entries, changed)
+        for keyword, entry in entries.items():
+            if entry.module_file in changed:
+                print(f"已重新加载模块 {keyword}: {entry.module_file}")
+            elif self._entries.get(keyword) is not entry:
+                print(f"关键词 {keyword} 改由 {entry.module_file} 注册")
+
+        self._replace_entries(entries)
+        self._file_entries = file_entries
+        self._records = records
+        self._write_snapshot()
+
+    def _file_order(self, module_file: str) -> Tuple[int, str]:
+        """
+        文件的扫描顺序：先按模块目录（core目录优先），再按文件名
+        """
+        module_dir = os.path.dirname(module_file)
+        for index, (candidate_dir, _) in enumerate(self._module_dirs):
+            if candidate_dir == module_dir:
+                return index, module_file
+        return len(self._module_dirs), module_file
+
+    def _resolve_entries(self, file_entries: Dict[str, ModuleEntry],
+                         report: Optional[set] = None) -> Dict[str, ModuleEntry]:
+        """
+        按扫描顺序决定关键词归属，关键词重复时靠前的文件注册，其余文件被忽略
+        只为report中的文件（为None时为全部文件）打印重复提示
+        """
+        entries: Dict[str, ModuleEntry] = {}
+        for module_file in sorted(file_entries, key=self._file_order):
+            entry = file_entries[module_file]
+            existing = entries.get(entry.keyword)
+            if existing is None:
+                entries[entry.keyword] = entry
+            elif report is None or module_file in report or existing.module_file in report:
+                print(f"关键词 {entry.keyword} 重复: {module_file} 被忽略，"
+                      f"已由 {existing.module_file} 注册")
+        return entries
+
+    def _replace_entries(self, entries: Dict[str, ModuleEntry]) -> None:
+        """
+        用新条目替换索引
+        文件没有变化的模块沿用已导入的模块对象；被替换或删除的模块从sys.modules中移除，
+        旧模块对象在正在处理的消息结束后即可被回收
+        """
+        old_entries = self._entries
+        for keyword, entry in entries.items():
+            old = old_entries.get(keyword)
+            if (old is not None and old is not entry and entry.module is None and old.module is not None
+                    and old.module_file == entry.module_file and old.file_version == entry.file_version):
+                entry.module = old.module
+                entry.import_seconds = old.import_seconds
+                entry.last_used = old.last_used
+        self._rebuild(entries)
+        for keyword, old in old_entries.items():
+            entry = entries.get(keyword)
+            if old.module is not None and (entry is None or entry.module is not old.module):
+                old.unload()
+
+    def _rebuild(self, entries: Dict[str, ModuleEntry]) -> None:
+        """
+        根据条目重建派生索引，并一次性替换，保证读取方看到的是完整的索引
+        """
+        keywords = [keyword for keyword, entry in entries.items() if entry.has_keyword]
+        # 按长度降序排序关键词，以便优先匹配较长的关键词
+        keywords.sort(key=len, reverse=True)
+        module_info = {keyword: entry.summary() for keyword, entry in entries.items()}
+        # 如果keyword等于usage，说明该功能不需要传参，只有当消息完全等于keyword时才触发
+        exact = {keyword: keyword == info.get('usage', '') for keyword, info in module_info.items()}
+        matcher = KeywordMatcher()
+        for keyword in keywords:
+            owner = matcher.find(keyword)
+            if owner is not None:
+                print(f"关键词冲突: {keyword} 与 {owner} 忽略大小写后相同，优先使用 {owner}")
+            matcher.add(keyword, exact[keyword])
+        names = {keyword: keyword for keyword in entries}
+
+        # 别名与关键词使用同一棵前缀树，与已有关键词或别名冲突的别名被忽略
+        for keyword, entry in entries.items():
+            for alias in get_info_list(entry.info, 'aliases'):
+                owner = names.get(alias) or matcher.find(alias)
+                if owner is not None:
+                    print(f"别名冲突: {keyword} 的别名 {alias} 已被 {owner} 使用，已忽略")
+                    continue
+                matcher.add(alias, exact[keyword], target=keyword)
+                names[alias] = keyword
+
+        # 所有模块的正则触发器合并为一个正则表达式，关键词和别名优先于正则触发器
+        pattern_matcher = PatternMatcher(
+            (keyword, pattern) for keyword, entry in entries.items()
+            for pattern in get_info_list(entry.info, 'patterns')
+        )
+        for keyword, pattern, compiled in pattern_matcher.patterns:
+            shadowed = sorted(name for name, owner in names.items() if owner != keyword and compiled.match(name))
+            if shadowed:
+                print(f"触发模式冲突: {keyword} 的触发模式 {pattern!r} 也能匹配 {', '.join(shadowed)}，"
+                      f"这些消息仍由关键词对应的功能处理")
+
+        # 前缀树忽略大小写，按首词查找时区分大小写，两种首字符都要收录
+        first_chars = {name[0] for name in names if name}
+        first_chars.update(name[0].lower()[:1] for name in names if name)
+
+        self._entries = entries
+        self._keywords = keywords
+        self._module_info = module_info
+        self._matcher = matcher
+        self._pattern_matcher = pattern_matcher
+        self._names = names
+        self._first_chars = frozenset(first_chars)
+        self.version += 1
+
+    def ensure_loaded(self) -> None:
+        if not self._loaded:
+            self.scan()
+
+    def get_entry(self, keyword: str) -> Optional[ModuleEntry]:
+        self.ensure_loaded()
+        return self._entries.get(keyword)
+
+    def get_entries(self) -> List[ModuleEntry]:
+        self.ensure_loaded()
+        return list(self._entries.values())
+
+    def get_keywords(self) -> List[str]:
+        self.ensure_loaded()
+        return self._keywords
+
+    def get_module_info(self) -> Dict[str, Dict[str, Any]]:
+        self.ensure_loaded()
+        return self._module_info
+
+    def match(self, message: str) -> Optional[Tuple[str, str]]:
+        self.ensure_loaded()
+        return self._matcher.match(message)
+
+    def resolve_name(self, name: str) -> Optional[str]:
+        """
+        把关键词或别名解析为模块的关键词，忽略大小写，找不到时返回None
+        """
+        self.ensure_loaded()
+        return self._names.get(name) or self._matcher.find(name)
+
+    def unload_idle(self, idle_seconds: float) -> List[str]:
+        """
+        释放超过idle_seconds没有使用的func模块，返回被释放的关键词
+        core模块常驻内存；声明了process: True的模块不在主进程中导入
+        """
+        self.ensure_loaded()
+        deadline = time.monotonic() - idle_seconds
+        unloaded = []
+        for entry in self._entries.values():
+            if entry.module is not None and entry.module_type == "func" and entry.last_used < deadline:
+                entry.unload()
+                unloaded.append(entry.keyword)
+        return unloaded
+
+    def match_command(self, message: str) -> Optional[Tuple[str, str]]:
+        """
+        判断消息是否是命令，先按首字符快速排除闲聊，再匹配关键词和别名的前缀树，
+        未匹配时消息的第一个词等于某个模块的关键词或别名也视为命令，最后尝试合并后的正则触发器
+        返回格式：(keyword, args_text) 或 None
+        """
+        self.ensure_loaded()
+        if message:
+            first = message[0]
+            if first in self._first_chars or first.lower()[:1] in self._first_chars:
+                matched = self._matcher.match(message)
+                if matched is not None:
+                    return matched
+                words = message.split(None, 1)
+                keyword = self._names.get(words[0]) if words else None
+                if keyword is not None:
+                    return keyword, message[len(words[0]):].strip()
+            if self._pattern_matcher:
+                matched = self._pattern_matcher.match(message)
+                if matched is not None:
+                    return matched
+        self.rejected += 1
+        return None
+
+
+# 创建全局实例
+registry = ModuleRegistry(snapshot_file=os.path.join(get_base_dir(), 'config', 'module_index.json'))
+
+
 def get_available_keywords() -> List[str]:
     """
     获取所有可用的关键词
-    仅返回实现了get_info()函数的模块的关键词，排除module_loader自身
+    仅返回实现了get_info()函数且声明了keyword的模块的关键词，排除module_loader自身
+    已按长度降序排序，返回的列表请勿修改
     """
-    available_keywords = []
-    
-    # 获取项目根目录
-    base_dir = get_base_dir()
-    
-    # 获取core目录中的关键词
-    core_dir = os.path.join(base_dir, 'core')
-    if os.path.exists(core_dir):
-        for file in os.listdir(core_dir):
-            # 跳过__init__.py和module_loader.py自身
-            if file.endswith(".py") and file != "__init__.py" and file != "module_loader.py":
-                try:
-                    # 动态导入模块
-                    module_name = file[:-3]
-                    spec = importlib.util.spec_from_file_location(module_name, os.path.join(core_dir, file))
-                    module = importlib.util.module_from_spec(spec)
-                    spec.loader.exec_module(module)
-                    
-                    # 检查是否实现了get_info()函数
-                    if hasattr(module, 'get_info') and callable(module.get_info):
-                        # 获取关键词
-                        keyword = get_module_keyword(module)
-                        if keyword:
-                            available_keywords.append(keyword)
-                except Exception as e:
-                    print(f"Error loading keyword from {file}: {e}")
-    
-    # 获取func目录中的关键词
-    func_dir = os.path.join(base_dir, 'func')
-    if os.path.exists(func_dir):
-        for file in os.listdir(func_dir):
-            if file.endswith(".py") and file != "__init__.py":
-                try:
-                    # 动态导入模块
-                    module_name = file[:-3]
-                    spec = importlib.util.spec_from_file_location(module_name, os.path.join(func_dir, file))
-                    module = importlib.util.module_from_spec(spec)
-                    spec.loader.exec_module(module)
-                    
-                    # 检查是否实现了get_info()函数
-                    if hasattr(module, 'get_info') and callable(module.get_info):
-                        # 获取关键词
-                        keyword = get_module_keyword(module)
-                        if keyword:
-                            available_keywords.append(keyword)
-                except Exception as e:
-                    print(f"Error loading keyword from {file}: {e}")
-    
-    # 按长度降序排序关键词，以便优先匹配较长的关键词
-    available_keywords.sort(key=len, reverse=True)
-    return available_keywords
+    return registry.get_keywords()
 
 
 def get_module_info() -> Dict[str, Dict[str, str]]:
@@ -110,190 +794,81 @@ def get_module_info() -> Dict[str, Dict[str, str]]:
     获取所有模块的信息，包括关键词和描述
     仅处理实现了get_info()函数的模块，排除module_loader自身
     返回格式：{keyword: {"description": description, "type": "core|func"}}
+    返回的字典请勿修改
     """
-    module_info = {}
-    
-    # 获取项目根目录
-    base_dir = get_base_dir()
-    
-    # 获取core目录中的模块信息
-    core_dir = os.path.join(base_dir, 'core')
-    if os.path.exists(core_dir):
-        for file in os.listdir(core_dir):
-            # 跳过__init__.py和module_loader.py自身
-            if file.endswith(".py") and file != "__init__.py" and file != "module_loader.py":
-                try:
-                    # 动态导入模块
-                    module_name = file[:-3]
-                    spec = importlib.util.spec_from_file_location(module_name, os.path.join(core_dir, file))
-                    module = importlib.util.module_from_spec(spec)
-                    spec.loader.exec_module(module)
-                    
-                    # 检查是否实现了get_info()函数
-                    if hasattr(module, 'get_info') and callable(module.get_info):
-                        # 获取关键词和描述
-                        keyword = get_module_keyword(module)
-                        if not keyword:
-                            keyword = module_name
-                        
-                        description = get_module_description(module)
-                        
-                        # 获取额外信息
-                        extra_info = {}
-                        try:
-                            info = module.get_info()
-                            if isinstance(info, dict):
-                                # 移除已处理的关键词和描述
-                                info_copy = info.copy()
-                                info_copy.pop('keyword', None)
-                                info_copy.pop('description', None)
-                                extra_info = info_copy
-                        except Exception as e:
-                            print(f"Error getting extra info from {file}: {e}")
-                        
-                        module_info[keyword] = {
-                            "description": description,
-                            "type": "core",
-                            **extra_info
-                        }
-                except Exception as e:
-                    print(f"Error loading module info from {file}: {e}")
-    
-    # 获取func目录中的模块信息
-    func_dir = os.path.join(base_dir, 'func')
-    if os.path.exists(func_dir):
-        for file in os.listdir(func_dir):
-            if file.endswith(".py") and file != "__init__.py":
-                try:
-                    # 动态导入模块
-                    module_name = file[:-3]
-                    spec = importlib.util.spec_from_file_location(module_name, os.path.join(func_dir, file))
-                    module = importlib.util.module_from_spec(spec)
-                    spec.loader.exec_module(module)
-                    
-                    # 检查是否实现了get_info()函数
-                    if hasattr(module, 'get_info') and callable(module.get_info):
-                        # 获取关键词和描述
-                        keyword = get_module_keyword(module)
-                        if not keyword:
-                            keyword = module_name
-                        
-                        description = get_module_description(module)
-                        
-                        # 获取额外信息
-                        extra_info = {}
-                        try:
-                            info = module.get_info()
-                            if isinstance(info, dict):
-                                # 移除已处理的关键词和描述
-                                info_copy = info.copy()
-                                info_copy.pop('keyword', None)
-                                info_copy.pop('description', None)
-                                extra_info = info_copy
-                        except Exception as e:
-                            print(f"Error getting extra info from {file}: {e}")
-                        
-                        module_info[keyword] = {
-                            "description": description,
-                            "type": "func",
-                            **extra_info
-                        }
-                except Exception as e:
-                    print(f"Error loading module info from {file}: {e}")
-    
-    return module_info
+    return registry.get_module_info()
+
+
+def match_keyword(message: str) -> Optional[Tuple[str, str]]:
+    """
+    匹配消息开头的关键词，较长的关键词优先
+    返回格式：(keyword, args_text) 或 None
+    """
+    return registry.match(message)
 
 
-def find_module_by_keyword(keyword: str, admin_id: str = None, sender_id: str = None) -> Optional[Tuple[str, str]]:
+def resolve_name(name: str) -> Optional[str]:
+    """
+    把关键词或别名解析为模块的关键词，找不到时返回None
+    """
+    return registry.resolve_name(name)
+
+
+def match_command(message: str) -> Optional[Tuple[str, str]]:
+    """
+    匹配消息中的命令，不是命令时返回None
+    返回格式：(keyword, args_text) 或 None
+    """
+    return registry.match_command(message)
+
+
+def find_module_by_keyword(keyword: str, admin_id: str = None, sender_id: str = None,
+                           group_id: str = None) -> Optional[Tuple[str, str]]:
     """
     根据关键词查找对应的模块文件
     仅考虑实现了get_info()函数的模块，排除module_loader自身
+    传入sender_id和group_id时同时检查针对该用户和群的禁用策略
     返回格式：(module_file, module_type) 或 None
     """
     # 首先检查功能是否被禁用
-    if feature_disabler.is_disabled(keyword):
+    if feature_disabler.is_disabled(keyword, group_id, sender_id):
         print(f"功能 {keyword} 已被禁用")
         return 'feature_disabler'
-        
-    # 获取项目根目录
-    base_dir = get_base_dir()
-    core_dir = os.path.join(base_dir, 'core')
-    func_dir = os.path.join(base_dir, 'func')
-    
-    module_file = None
-    module_type = None
-    
-    # 优先在core目录中查找
-    if os.path.exists(core_dir):
-        for file in os.listdir(core_dir):
-            # 跳过__init__.py和module_loader.py自身
-            if file.endswith(".py") and file != "__init__.py" and file != "module_loader.py":
-                try:
-                    # 动态导入模块
-                    module_name = file[:-3]
-                    spec = importlib.util.spec_from_file_location(module_name, os.path.join(core_dir, file))
-                    module = importlib.util.module_from_spec(spec)
-                    spec.loader.exec_module(module)
-                    
-                    # 检查是否实现了get_info()函数
-                    if hasattr(module, 'get_info') and callable(module.get_info):
-                        # 检查关键词是否匹配
-                        module_keyword = get_module_keyword(module)
-                        if not module_keyword:
-                            module_keyword = module_name
-                            
-                        if module_keyword == keyword:
-                            module_file = os.path.join(core_dir, file)
-                            module_type = "core"
-                            break
-                except Exception as e:
-                    print(f"Error checking module {file}: {e}")
-    
-    # 如果在core目录中没有找到，则在func目录中查找
-    if module_file is None and os.path.exists(func_dir):
-        for file in os.listdir(func_dir):
-            if file.endswith(".py") and file != "__init__.py":
-                try:
-                    # 动态导入模块
-                    module_name = file[:-3]
-                    spec = importlib.util.spec_from_file_location(module_name, os.path.join(func_dir, file))
-                    module = importlib.util.module_from_spec(spec)
-                    spec.loader.exec_module(module)
-                    
-                    # 检查是否实现了get_info()函数
-                    if hasattr(module, 'get_info') and callable(module.get_info):
-                        # 检查关键词是否匹配
-                        module_keyword = get_module_keyword(module)
-                        if not module_keyword:
-                            module_keyword = module_name
-                            
-                        if module_keyword == keyword:
-                            module_file = os.path.join(func_dir, file)
-                            module_type = "func"
-                            break
-                except Exception as e:
-                    print(f"Error checking module {file}: {e}")
-    
-    # 不再尝试使用文件名作为关键词的方式查找，因为没有get_info()函数的模块不被视为功能脚本
-    if module_file is None:
+
+    entry = registry.get_entry(keyword)
+    # 没有get_info()函数的模块不被视为功能脚本
+    if entry is None:
         return None
-    
-    return (module_file, module_type)
+
+    return (entry.module_file, entry.module_type)
+
+
+def get_module(keyword: str):
+    """
+    获取关键词对应的模块对象，首次使用时导入，之后不会重新执行模块
+    """
+    entry = registry.get_entry(keyword)
+    if entry is None:
+        return None
+    return entry.load()
 
 
 def load_module(module_file: str, keyword: str):
     """
-    动态加载模块
+    加载模块并返回模块对象
+    注册表中的模块直接复用已导入的对象；其他文件按 langbotbox.<类型>.<文件名> 登记到sys.modules，
+    文件没有变化时重复调用返回同一个模块对象
     """
-    try:
-        spec = importlib.util.spec_from_file_location(keyword, module_file)
-        module = importlib.util.module_from_spec(spec)
-        sys.modules[keyword] = module
-        spec.loader.exec_module(module)
+    module_file = os.path.abspath(module_file)
+    entry = registry.get_entry(keyword)
+    if entry is not None and entry.module_file == module_file:
+        return entry.load()
+
+    module_name = get_module_name(module_file, registry.get_module_type(module_file) or "func")
+    module = sys.modules.get(module_name)
+    if module is not None and getattr(module, '__langbotbox_version__', None) == get_file_version(module_file):
         return module
-    except Exception as e:
-        print(f"Error loading module {module_file}: {e}")
-        return None
+    return import_module_file(module_file, module_name, register=True)
 
 
 async def execute(event_context, request_dict) -> str:
@@ -304,7 +879,7 @@ async def execute(event_context, request_dict) -> str:
     args = request_dict.get('args', [])
     
     if not args:
-        return "模块加载器：请提供要执行的操作，如 list, info, load"
+        return "模块加载器：请提供要执行的操作，如 list, info, reload, load"
     
     operation = args[0]
     
@@ -316,9 +891,18 @@ async def execute(event_context, request_dict) -> str:
         module_info = get_module_info()
         result = "模块信息：\n"
         for keyword, info in module_info.items():
-            result += f"{keyword} ({info['type']}): {info['description']}\n"
+            entry = registry.get_entry(keyword)
+            if entry is not None and entry.module is not None and entry.import_seconds is not None:
+                state = f"，已加载，导入耗时 {entry.import_seconds * 1000:.1f}ms"
+            else:
+                state = ""
+            result += f"{keyword} ({info['type']}{state}): {info['description']}\n"
         return result
     
+    elif operation == "reload":
+        registry.scan()
+        return f"已重新扫描模块，共 {len(get_module_info())} 个"
+    
     elif operation == "load" and len(args) > 1:
         keyword = args[1]
         module_tuple = find_module_by_keyword(keyword)
@@ -332,4 +916,4 @@ async def execute(event_context, request_dict) -> str:
         else:
             return f"未找到关键词 '{keyword}' 对应的模块"
     
-    return "未知操作，可用操作：list, info, load <keyword>"
\ No newline at end of file
+    return "未知操作，可用操作：list, info, reload, load <keyword>"
\ No newline at end of file
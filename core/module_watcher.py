@@ -0,0 +1,167 @@
+# module_watcher.py - 模块文件变化监听，实现core/func目录的热重载
+
+import asyncio
+import ctypes
+import ctypes.util
+import os
+import struct
+from typing import Dict, List, Optional, Tuple
+
+# inotify事件掩码，见 <sys/inotify.h>
+IN_MODIFY = 0x00000002
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_NONBLOCK = os.O_NONBLOCK
+IN_CLOEXEC = 0o2000000
+
+_WATCH_MASK = IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE
+_EVENT_HEADER = struct.Struct("iIII")
+
+
+class _Inotify:
+    """
+    通过ctypes调用libc的inotify接口，不可用时在构造时抛出OSError
+    """
+    def __init__(self):
+        libc_name = ctypes.util.find_library("c")
+        if not libc_name:
+            raise OSError("未找到libc")
+        self._libc = ctypes.CDLL(libc_name, use_errno=True)
+        if not hasattr(self._libc, "inotify_init1"):
+            raise OSError("当前系统不支持inotify")
+        self.fd = self._libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1失败")
+
+    def add_watch(self, path: str) -> None:
+        wd = self._libc.inotify_add_watch(self.fd, os.fsencode(path), _WATCH_MASK)
+        if wd < 0:
+            raise OSError(ctypes.get_errno(), f"无法监听目录 {path}")
+
+    def read_events(self) -> bool:
+        """
+        读出所有待处理的事件，有事件返回True
+        """
+        has_events = False
+        while True:
+            try:
+                data = os.read(self.fd, 64 * 1024)
+            except BlockingIOError:
+                return has_events
+            if not data:
+                return has_events
+            offset = 0
+            while offset + _EVENT_HEADER.size <= len(data):
+                _, _, _, name_len = _EVENT_HEADER.unpack_from(data, offset)
+                offset += _EVENT_HEADER.size + name_len
+                has_events = True
+
+    def close(self) -> None:
+        os.close(self.fd)
+
+
+class ModuleWatcher:
+    """
+    监听模块目录的文件变化，只重新加载发生变化的模块文件
+
+    优先使用inotify，在不支持的平台上退回到定时比较文件的mtime和大小。
+    inotify事件只作为触发信号，具体哪些文件变化由文件状态快照比较得出，
+    同时对连续的写入事件做了防抖，避免编辑器保存时重复加载。
+    """
+    def __init__(self, registry, poll_interval: float = 2.0, debounce: float = 0.3):
+        self.registry = registry
+        self.poll_interval = poll_interval
+        self.debounce = debounce
+        self._directories = [module_dir for module_dir, _ in registry.get_module_dirs()]
+        self._snapshot: Dict[str, Tuple[int, int]] = {}
+        self._inotify: Optional[_Inotify] = None
+        self._poll_task: Optional[asyncio.Task] = None
+        self._pending: Optional[asyncio.TimerHandle] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    def _take_snapshot(self) -> Dict[str, Tuple[int, int]]:
+        """
+        记录目录中所有.py文件的(mtime, size)
+        """
+        snapshot = {}
+        for directory in self._directories:
+            try:
+                with os.scandir(directory) as it:
+                    for item in it:
+                        if item.name.endswith(".py") and item.is_file():
+                            stat = item.stat()
+                            snapshot[item.path] = (stat.st_mtime_ns, stat.st_size)
+            except FileNotFoundError:
+                continue
+        return snapshot
+
+    def check_changes(self) -> List[str]:
+        """
+        与上一次快照比较，重新加载变化的文件，返回变化的文件列表
+        """
+        snapshot = self._take_snapshot()
+        changed = [path for path in snapshot.keys() | self._snapshot.keys()
+                   if snapshot.get(path) != self._snapshot.get(path)]
+        self._snapshot = snapshot
+        if changed:
+            try:
+                self.registry.reload_files(changed)
+            except Exception as e:
+                print(f"热重载模块失败: {e}")
+        return changed
+
+    def start(self) -> None:
+        """
+        在当前事件循环中开始监听
+        """
+        if self._loop is not None:
+            return
+        self._loop = asyncio.get_running_loop()
+        self._snapshot = self._take_snapshot()
+
+        inotify = None
+        try:
+            inotify = _Inotify()
+            for directory in self._directories:
+                if os.path.isdir(directory):
+                    inotify.add_watch(directory)
+            self._loop.add_reader(inotify.fd, self._on_inotify_event)
+            self._inotify = inotify
+        except (OSError, NotImplementedError) as e:
+            print(f"inotify不可用，使用轮询方式监听模块变化: {e}")
+            if inotify is not None:
+                inotify.close()
+            self._poll_task = self._loop.create_task(self._poll())
+
+    def stop(self) -> None:
+        if self._inotify is not None:
+            self._loop.remove_reader(self._inotify.fd)
+            self._inotify.close()
+            self._inotify = None
+        if self._poll_task is not None:
+            self._poll_task.cancel()
+            self._poll_task = None
+        if self._pending is not None:
+            self._pending.cancel()
+            self._pending = None
+        self._loop = None
+
+    def _on_inotify_event(self) -> None:
+        if not self._inotify.read_events():
+            return
+        # 防抖：最后一次事件之后一段时间再统一检查
+        if self._pending is not None:
+            self._pending.cancel()
+        self._pending = self._loop.call_later(self.debounce, self._flush)
+
+    def _flush(self) -> None:
+        self._pending = None
+        self.check_changes()
+
+    async def _poll(self) -> None:
+        while True:
+            await asyncio.sleep(self.poll_interval)
+            self.check_changes()
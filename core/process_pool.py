@@ -0,0 +1,188 @@
+# process_pool.py - 在预热的进程池中执行CPU密集型模块
+
+import asyncio
+import importlib.util
+import multiprocessing
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Dict, List, Optional, Tuple
+
+# 进程池的默认大小
+DEFAULT_MAX_WORKERS = 2
+# 进程池累计执行多少个任务后整体替换（按每个工作进程计算）
+DEFAULT_MAX_TASKS_PER_WORKER = 100
+# 工作进程的内存占用超过该值（MB）后替换进程池
+DEFAULT_MAX_RSS_MB = 512
+
+# 传给工作进程的request_dict中需要去掉的字段（无法序列化或绑定在主进程上）
+UNPICKLABLE_FIELDS = ('http_client',)
+
+# 工作进程中已导入的模块，key为模块文件，值为(mtime, 模块对象)
+_worker_modules: Dict[str, Tuple[int, Any]] = {}
+
+
+def _current_rss() -> int:
+    """
+    当前进程的内存占用（字节）
+    """
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError, AttributeError):
+        pass
+    try:
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # Linux上单位为KB，macOS上为字节
+        return peak if sys.platform == 'darwin' else peak * 1024
+    except (ImportError, OSError):
+        return 0
+
+
+def _import_in_worker(module_file: str):
+    """
+    在工作进程中导入模块，文件修改后重新导入
+    """
+    mtime = os.stat(module_file).st_mtime_ns
+    cached = _worker_modules.get(module_file)
+    if cached is not None and cached[0] == mtime:
+        return cached[1]
+    module_name = 'langbotbox_process.' + os.path.basename(module_file)[:-3]
+    spec = importlib.util.spec_from_file_location(module_name, module_file)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    _worker_modules[module_file] = (mtime, module)
+    return module
+
+
+def _warm_worker(module_files: List[str]) -> int:
+    """
+    预先导入模块，返回工作进程的PID
+    """
+    for module_file in module_files:
+        try:
+            _import_in_worker(module_file)
+        except Exception as e:
+            print(f"工作进程预加载模块 {module_file} 失败: {e}")
+    return os.getpid()
+
+
+def _execute_in_worker(module_file: str, request_dict: Dict[str, Any]) -> Tuple[Any, int]:
+    """
+    在工作进程中执行模块的execute，返回(结果, 当前内存占用)
+    工作进程中没有事件上下文，event_context为None
+    """
+    module = _import_in_worker(module_file)
+    result = module.execute(None, request_dict)
+    if asyncio.iscoroutine(result):
+        result = asyncio.run(result)
+    return result, _current_rss()
+
+
+class ProcessRunner:
+    """
+    预热的进程池，用于执行在get_info()中声明了process: True的模块
+
+    模块在工作进程中导入和执行，execute收到的event_context为None，
+    request_dict只包含可序列化的字段（没有http_client），返回值必须可以pickle。
+    进程池累计执行max_tasks_per_worker * max_workers个任务，或者某个工作进程的内存占用超过max_rss_mb后，
+    会新建并预热一个进程池替换旧的，旧进程池在已提交的任务完成后退出。
+    工作进程崩溃时只影响当时在该进程池中执行的请求，进程池随即被替换。
+    """
+    def __init__(self, max_workers: int = DEFAULT_MAX_WORKERS,
+                 max_tasks_per_worker: int = DEFAULT_MAX_TASKS_PER_WORKER,
+                 max_rss_mb: float = DEFAULT_MAX_RSS_MB):
+        self.max_workers = max_workers
+        self.max_tasks_per_worker = max_tasks_per_worker
+        self.max_rss_mb = max_rss_mb
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._tasks = 0
+        self._warm_files: List[str] = []
+        # 进程池被替换的次数
+        self.recycled = 0
+        # 工作进程崩溃的次数
+        self.crashes = 0
+
+    def configure(self, max_workers: int = None, max_tasks_per_worker: int = None,
+                  max_rss_mb: float = None) -> None:
+        if max_workers:
+            self.max_workers = max(1, int(max_workers))
+        if max_tasks_per_worker:
+            self.max_tasks_per_worker = max(1, int(max_tasks_per_worker))
+        if max_rss_mb:
+            self.max_rss_mb = float(max_rss_mb)
+
+    def _create_pool(self) -> ProcessPoolExecutor:
+        # 不使用fork，避免复制主进程中的事件循环和线程状态
+        pool = ProcessPoolExecutor(max_workers=self.max_workers,
+                                   mp_context=multiprocessing.get_context('spawn'))
+        # 提交与进程数相同的预热任务，让所有工作进程立即启动并导入模块
+        for _ in range(self.max_workers):
+            pool.submit(_warm_worker, list(self._warm_files))
+        self._tasks = 0
+        return pool
+
+    def start(self, module_files: List[str] = None) -> None:
+        """
+        创建进程池并预先导入module_files中的模块
+        """
+        if module_files is not None:
+            self._warm_files = list(module_files)
+        if self._pool is None:
+            self._pool = self._create_pool()
+
+    def _recycle(self) -> None:
+        """
+        用新的预热进程池替换当前进程池
+        """
+        old_pool, self._pool = self._pool, self._create_pool()
+        if old_pool is not None:
+            old_pool.shutdown(wait=False)
+        self.recycled += 1
+
+    async def run(self, module_file: str, request_dict: Dict[str, Any]) -> Any:
+        """
+        在进程池中执行模块文件的execute并返回结果
+        """
+        if module_file not in self._warm_files:
+            self._warm_files.append(module_file)
+        if self._pool is None:
+            self._pool = self._create_pool()
+        pool = self._pool
+        request_dict = {key: value for key, value in request_dict.items() if key not in UNPICKLABLE_FIELDS}
+        try:
+            result, rss = await asyncio.wrap_future(pool.submit(_execute_in_worker, module_file, request_dict))
+        except BrokenProcessPool:
+            self.crashes += 1
+            if self._pool is pool:
+                self._recycle()
+            raise RuntimeError("工作进程异常退出")
+
+        if self._pool is pool:
+            self._tasks += 1
+            if (self._tasks >= self.max_tasks_per_worker * self.max_workers
+                    or rss > self.max_rss_mb * 1024 * 1024):
+                self._recycle()
+        return result
+
+    def shutdown(self) -> None:
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+
+
+# 创建全局实例
+runner = ProcessRunner()
+
+
+# 提供便捷函数
+def configure(max_workers: int = None, max_tasks_per_worker: int = None, max_rss_mb: float = None) -> None:
+    runner.configure(max_workers, max_tasks_per_worker, max_rss_mb)
+
+def start(module_files: List[str] = None) -> None:
+    runner.start(module_files)
+
+async def run(module_file: str, request_dict: Dict[str, Any]) -> Any:
+    return await runner.run(module_file, request_dict)
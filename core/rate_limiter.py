@@ -0,0 +1,159 @@
+# rate_limiter.py - 基于令牌桶的请求频率限制
+
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, List, Optional, Tuple
+
+# 最多同时记录的令牌桶数量，超出时淘汰最久未使用的
+DEFAULT_MAX_BUCKETS = 100000
+# 每次检查时最多顺带清理的空闲令牌桶数量
+EVICT_BATCH = 8
+
+# 限流的维度
+SCOPE_USER = 'user'
+SCOPE_GROUP = 'group'
+SCOPE_KEYWORD = 'keyword'
+SCOPES = (SCOPE_USER, SCOPE_GROUP, SCOPE_KEYWORD)
+
+# (容量, 每秒补充的令牌数)
+Rate = Tuple[float, float]
+
+
+def parse_rate(spec: Any) -> Optional[Rate]:
+    """
+    解析"次数/秒数"格式的频率，例如"5/60"表示60秒内最多5次
+    空值或格式错误时返回None（不限流）
+    """
+    if not spec:
+        return None
+    try:
+        count, seconds = str(spec).split('/', 1)
+        count, seconds = float(count), float(seconds)
+    except ValueError:
+        print(f"频率限制格式错误: {spec}，应为 次数/秒数")
+        return None
+    if count <= 0 or seconds <= 0:
+        return None
+    return count, count / seconds
+
+
+class RateLimiter:
+    """
+    按用户、群和关键词限制功能的调用频率
+
+    get_info()中可声明的字段：
+        rate_limit : {"user": "次数/秒数", "group": "次数/秒数", "keyword": "次数/秒数"}
+            user为每个用户、group为每个群、keyword为所有人合计调用该功能的频率，
+            未声明的维度使用配置中的默认值，值为空字符串时该维度不限流
+    令牌在检查时按经过的时间惰性补充；已经补满的令牌桶与不存在等价，会被顺带清理，
+    总数超过max_buckets时淘汰最久未使用的令牌桶，因此内存占用有上限。
+    """
+    def __init__(self, max_buckets: int = DEFAULT_MAX_BUCKETS):
+        self.max_buckets = max_buckets
+        # key为(维度, ID, 关键词)，值为[剩余令牌, 更新时间, 补满时间, 是否已提示]
+        self._buckets: "OrderedDict[Hashable, List]" = OrderedDict()
+        self._defaults: Dict[str, Optional[Rate]] = {scope: None for scope in SCOPES}
+        self._rate_cache: Dict[Any, Optional[Rate]] = {}
+        # 被限流的请求数
+        self.rejected = 0
+
+    def set_defaults(self, user: Any = None, group: Any = None, keyword: Any = None) -> None:
+        """
+        设置默认频率，对所有未在get_info()中声明对应维度的功能生效
+        """
+        self._defaults = {
+            SCOPE_USER: parse_rate(user),
+            SCOPE_GROUP: parse_rate(group),
+            SCOPE_KEYWORD: parse_rate(keyword),
+        }
+
+    def _get_rate(self, module_info: Dict[str, Any], scope: str) -> Optional[Rate]:
+        limits = module_info.get('rate_limit')
+        if not limits or scope not in limits:
+            return self._defaults[scope]
+        spec = limits[scope]
+        if spec not in self._rate_cache:
+            self._rate_cache[spec] = parse_rate(spec)
+        return self._rate_cache[spec]
+
+    def check(self, keyword: str, module_info: Dict[str, Any], sender_id: Optional[str] = None,
+              group_id: Optional[str] = None) -> Optional[Tuple[float, bool]]:
+        """
+        检查并消耗令牌，所有维度都有令牌时才消耗
+        未被限流时返回None，被限流时返回(需要等待的秒数, 是否是本次限流期间第一次被拒绝)
+        """
+        now = time.monotonic()
+        self._evict_idle(now)
+
+        checked = []
+        wait = 0.0
+        for scope, target in ((SCOPE_USER, sender_id), (SCOPE_GROUP, group_id), (SCOPE_KEYWORD, '')):
+            if target is None:
+                continue
+            rate = self._get_rate(module_info, scope)
+            if rate is None:
+                continue
+            capacity, refill = rate
+            key = (scope, target, keyword)
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                bucket = [capacity, now, now, False]
+            else:
+                # 惰性补充令牌
+                bucket[0] = min(capacity, bucket[0] + (now - bucket[1]) * refill)
+                bucket[1] = now
+            if bucket[0] < 1:
+                wait = max(wait, (1 - bucket[0]) / refill)
+            checked.append((key, bucket, capacity, refill))
+
+        if wait > 0:
+            self.rejected += 1
+            first = False
+            for key, bucket, _, _ in checked:
+                if bucket[0] < 1 and not bucket[3]:
+                    bucket[3] = first = True
+                if key in self._buckets:
+                    self._buckets.move_to_end(key)
+            return wait, first
+
+        for key, bucket, capacity, refill in checked:
+            bucket[0] -= 1
+            bucket[2] = now + (capacity - bucket[0]) / refill
+            bucket[3] = False
+            self._buckets[key] = bucket
+            self._buckets.move_to_end(key)
+        while len(self._buckets) > self.max_buckets:
+            self._buckets.popitem(last=False)
+        return None
+
+    def _evict_idle(self, now: float) -> None:
+        """
+        从最久未使用的一端清理已经补满的令牌桶，每次最多清理EVICT_BATCH个
+        """
+        buckets = self._buckets
+        for _ in range(EVICT_BATCH):
+            if not buckets:
+                return
+            key = next(iter(buckets))
+            if buckets[key][2] > now:
+                return
+            del buckets[key]
+
+    def clear(self) -> None:
+        self._buckets.clear()
+
+    def __len__(self) -> int:
+        return len(self._buckets)
+
+
+# 创建全局实例
+limiter = RateLimiter()
+
+
+# 提供便捷函数
+def set_defaults(user: Any = None, group: Any = None, keyword: Any = None) -> None:
+    limiter.set_defaults(user, group, keyword)
+
+def check(keyword: str, module_info: Dict[str, Any], sender_id: Optional[str] = None,
+          group_id: Optional[str] = None) -> Optional[Tuple[float, bool]]:
+    return limiter.check(keyword, module_info, sender_id, group_id)
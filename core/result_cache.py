@@ -0,0 +1,118 @@
+# result_cache.py - 功能模块结果缓存
+
+import datetime
+import time
+from typing import Any, Dict, Hashable, Optional
+
+from core.lru_cache import TTLCache
+
+# 缓存的最大条目数
+DEFAULT_MAX_ENTRIES = 512
+
+
+class Uncached(str):
+    """
+    模块返回该类型的结果时不会被缓存，用于请求失败等临时性的提示
+    """
+
+
+def uncached(text: str) -> Uncached:
+    return Uncached(text)
+
+
+def freeze(value: Any) -> Hashable:
+    """
+    把请求字段转换为可哈希的值
+    """
+    if isinstance(value, (list, tuple)):
+        return tuple(freeze(item) for item in value)
+    if isinstance(value, dict):
+        return tuple(sorted((key, freeze(item)) for key, item in value.items()))
+    return value
+
+
+def _next_midnight() -> float:
+    """
+    下一个本地零点的时间戳
+    """
+    tomorrow = datetime.date.today() + datetime.timedelta(days=1)
+    return datetime.datetime.combine(tomorrow, datetime.time.min).timestamp()
+
+
+class ResultCache:
+    """
+    根据模块在get_info()中声明的策略缓存execute的结果
+
+    get_info()中可声明的字段：
+        cache_ttl : 缓存时间（秒）
+        cache_key : 组成缓存键的request_dict字段列表，默认为["args"]，不包含sender_id时所有人共享结果
+        cache_expire : 为"midnight"时缓存在本地零点失效，与cache_ttl同时声明时取较早的时间
+    两者都未声明的模块不缓存
+    """
+    def __init__(self, max_entries: int = DEFAULT_MAX_ENTRIES):
+        self._cache = TTLCache(maxsize=max_entries)
+
+    @staticmethod
+    def is_cacheable(module_info: Dict[str, Any]) -> bool:
+        return bool(module_info.get('cache_ttl')) or module_info.get('cache_expire') == 'midnight'
+
+    def make_key(self, keyword: str, module_info: Dict[str, Any], request_dict: Dict[str, Any],
+                 version: int = 0) -> Optional[Hashable]:
+        """
+        生成缓存键，模块未声明缓存策略时返回None
+        version为模块注册表的版本，模块重新加载后旧的缓存不再命中
+        """
+        if not self.is_cacheable(module_info):
+            return None
+        fields = module_info.get('cache_key', ['args'])
+        return (keyword, version, tuple(freeze(request_dict.get(field)) for field in fields))
+
+    def get(self, key: Optional[Hashable]) -> Optional[str]:
+        if key is None:
+            return None
+        return self._cache.get(key)
+
+    def set(self, key: Optional[Hashable], module_info: Dict[str, Any], result: Any) -> None:
+        """
+        缓存结果，None、非字符串和Uncached类型的结果不缓存
+        """
+        if key is None or not isinstance(result, str) or isinstance(result, Uncached):
+            return
+        expires_at = None
+        if module_info.get('cache_ttl'):
+            expires_at = time.time() + float(module_info['cache_ttl'])
+        if module_info.get('cache_expire') == 'midnight':
+            midnight = _next_midnight()
+            expires_at = midnight if expires_at is None else min(expires_at, midnight)
+        self._cache.set(key, result, expires_at=expires_at)
+
+    def clear(self) -> None:
+        self._cache.clear()
+
+    @property
+    def hits(self) -> int:
+        return self._cache.hits
+
+    @property
+    def misses(self) -> int:
+        return self._cache.misses
+
+    @property
+    def hit_rate(self) -> float:
+        return self._cache.hit_rate
+
+
+# 创建全局实例
+cache = ResultCache()
+
+
+# 提供便捷函数
+def make_key(keyword: str, module_info: Dict[str, Any], request_dict: Dict[str, Any],
+             version: int = 0) -> Optional[Hashable]:
+    return cache.make_key(keyword, module_info, request_dict, version)
+
+def get_cached(key: Optional[Hashable]) -> Optional[str]:
+    return cache.get(key)
+
+def store(key: Optional[Hashable], module_info: Dict[str, Any], result: Any) -> None:
+    cache.set(key, module_info, result)
@@ -0,0 +1,151 @@
+# scheduler.py - 限制并发并按优先级调度模块执行
+
+import asyncio
+import bisect
+import itertools
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+# 全局同时执行的命令数
+DEFAULT_MAX_INFLIGHT = 16
+# 排队等待的命令数上限，超出时直接返回繁忙
+DEFAULT_MAX_QUEUE = 100
+
+# 优先级，数值越小越先执行
+PRIORITY_ADMIN = 0
+PRIORITY_PRIVATE = 1
+PRIORITY_GROUP = 2
+
+
+class SchedulerBusy(Exception):
+    """
+    排队的命令已满
+    """
+
+
+class Scheduler:
+    """
+    位于关键词匹配和execute之间的调度器
+
+    全局同时执行的命令不超过max_inflight个，模块可以在get_info()中用max_concurrency
+    限制自身的并发数。没有空闲名额时按优先级（管理员 > 私聊 > 群聊）和到达顺序排队，
+    某个模块达到并发上限时不会阻塞排在后面的其他模块。队列已满时，优先级更高的新请求会挤掉
+    优先级最低的等待者中最晚到达的一个（被挤掉的请求抛出SchedulerBusy），否则新请求立即抛出SchedulerBusy。
+    """
+    def __init__(self, max_inflight: int = DEFAULT_MAX_INFLIGHT, max_queue: int = DEFAULT_MAX_QUEUE):
+        self.max_inflight = max_inflight
+        self.max_queue = max_queue
+        self.inflight = 0
+        self._running: Dict[str, int] = {}
+        # 按(优先级, 序号)排序的等待列表，元素为(priority, seq, keyword, limit, future)
+        self._waiters: List[tuple] = []
+        self._seq = itertools.count()
+        # 因队列已满被拒绝的命令数
+        self.rejected = 0
+
+    def configure(self, max_inflight: int = None, max_queue: int = None) -> None:
+        if max_inflight:
+            self.max_inflight = max(1, int(max_inflight))
+        if max_queue is not None:
+            self.max_queue = max(0, int(max_queue))
+        self._dispatch()
+
+    def _can_run(self, keyword: str, limit: Optional[int]) -> bool:
+        return (self.inflight < self.max_inflight
+                and (not limit or self._running.get(keyword, 0) < limit))
+
+    def _start(self, keyword: str) -> None:
+        self.inflight += 1
+        self._running[keyword] = self._running.get(keyword, 0) + 1
+
+    def _release(self, keyword: str) -> None:
+        self.inflight -= 1
+        count = self._running[keyword] - 1
+        if count:
+            self._running[keyword] = count
+        else:
+            del self._running[keyword]
+        self._dispatch()
+
+    def _dispatch(self) -> None:
+        """
+        按优先级唤醒可以执行的等待者
+        """
+        index = 0
+        while index < len(self._waiters) and self.inflight < self.max_inflight:
+            _, _, keyword, limit, future = self._waiters[index]
+            if future.done():
+                del self._waiters[index]
+            elif self._can_run(keyword, limit):
+                del self._waiters[index]
+                self._start(keyword)
+                future.set_result(None)
+            else:
+                index += 1
+
+    def _evict_for(self, priority: int) -> bool:
+        """
+        队列已满时为优先级更高的新请求腾出位置：拒绝优先级最低的等待者中最晚到达的一个
+        新请求的优先级不高于它时返回False，由新请求自己被拒绝
+        """
+        waiters = self._waiters
+        # 清理已经被取消的等待者
+        while waiters and waiters[-1][4].done():
+            waiters.pop()
+        if len(waiters) < self.max_queue:
+            return True
+        if not waiters or waiters[-1][0] <= priority:
+            return False
+        future = waiters.pop()[4]
+        self.rejected += 1
+        future.set_exception(SchedulerBusy())
+        return True
+
+    async def _acquire(self, keyword: str, limit: Optional[int], priority: int) -> None:
+        if not self._waiters and self._can_run(keyword, limit):
+            self._start(keyword)
+            return
+        if len(self._waiters) >= self.max_queue and not self._evict_for(priority):
+            self.rejected += 1
+            raise SchedulerBusy()
+
+        future = asyncio.get_running_loop().create_future()
+        waiter = (priority, next(self._seq), keyword, limit, future)
+        bisect.insort(self._waiters, waiter)
+        # 新来的请求可能可以直接执行（例如被阻塞的只是其他模块）
+        self._dispatch()
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                # 已经分配到名额后才被取消，归还名额
+                self._release(keyword)
+            elif waiter in self._waiters:
+                self._waiters.remove(waiter)
+            raise
+
+    async def run(self, keyword: str, func: Callable[[], Awaitable[Any]],
+                  max_concurrency: Optional[int] = None, priority: int = PRIORITY_GROUP) -> Any:
+        """
+        获得执行名额后执行func，队列已满时抛出SchedulerBusy
+        """
+        await self._acquire(keyword, max_concurrency, priority)
+        try:
+            return await func()
+        finally:
+            self._release(keyword)
+
+    def queued(self) -> int:
+        return len(self._waiters)
+
+
+# 创建全局实例
+scheduler = Scheduler()
+
+
+# 提供便捷函数
+def configure(max_inflight: int = None, max_queue: int = None) -> None:
+    scheduler.configure(max_inflight, max_queue)
+
+async def run(keyword: str, func: Callable[[], Awaitable[Any]],
+              max_concurrency: Optional[int] = None, priority: int = PRIORITY_GROUP) -> Any:
+    return await scheduler.run(keyword, func, max_concurrency, priority)
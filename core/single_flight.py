@@ -0,0 +1,73 @@
+# single_flight.py - 合并相同的并发请求
+
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional
+
+from core.result_cache import freeze
+
+
+class SingleFlight:
+    """
+    相同的请求同时到达时只执行一次，所有请求共享同一个执行结果
+
+    get_info()中可声明的字段：
+        coalesce : 为True时开启合并
+        coalesce_key : 判断请求是否相同的request_dict字段列表，默认为["args"]
+    合并后只有第一个请求的event_context和request_dict会传给execute，
+    因此开启合并的模块不应依赖发送者相关的信息（除非把sender_id加入coalesce_key）。
+    合并只发生在执行期间，不影响结果缓存的时间。
+    """
+    def __init__(self):
+        self._inflight: Dict[Hashable, asyncio.Future] = {}
+        # 被合并（没有实际执行）的请求数
+        self.coalesced = 0
+
+    def make_key(self, keyword: str, module_info: Dict[str, Any], request_dict: Dict[str, Any],
+                 version: int = 0) -> Optional[Hashable]:
+        """
+        生成合并键，模块未开启合并时返回None
+        """
+        if not module_info.get('coalesce'):
+            return None
+        fields = module_info.get('coalesce_key', ['args'])
+        return (keyword, version, tuple(freeze(request_dict.get(field)) for field in fields))
+
+    async def run(self, key: Optional[Hashable], func: Callable[[], Awaitable[Any]]) -> Any:
+        """
+        执行func，key相同的请求正在执行时直接等待其结果
+        """
+        if key is None:
+            return await func()
+
+        future = self._inflight.get(key)
+        if future is None:
+            future = asyncio.ensure_future(func())
+            self._inflight[key] = future
+            future.add_done_callback(lambda done: self._on_done(key, done))
+        else:
+            self.coalesced += 1
+        # 某个等待者被取消时不影响共享的执行和其他等待者
+        return await asyncio.shield(future)
+
+    def _on_done(self, key: Hashable, future: asyncio.Future) -> None:
+        if self._inflight.get(key) is future:
+            del self._inflight[key]
+        # 所有等待者都已取消时，避免出现异常未被获取的警告
+        if not future.cancelled():
+            future.exception()
+
+    def inflight_count(self) -> int:
+        return len(self._inflight)
+
+
+# 创建全局实例
+flights = SingleFlight()
+
+
+# 提供便捷函数
+def make_key(keyword: str, module_info: Dict[str, Any], request_dict: Dict[str, Any],
+             version: int = 0) -> Optional[Hashable]:
+    return flights.make_key(keyword, module_info, request_dict, version)
+
+async def run(key: Optional[Hashable], func: Callable[[], Awaitable[Any]]) -> Any:
+    return await flights.run(key, func)
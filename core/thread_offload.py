@@ -0,0 +1,127 @@
+# thread_offload.py - 在线程池中执行会阻塞事件循环的模块
+
+import asyncio
+import inspect
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Optional
+
+# 线程池的默认大小
+DEFAULT_MAX_WORKERS = 4
+
+
+class LoopProxy:
+    """
+    在线程中使用主事件循环上的对象（例如event_context）
+
+    异步方法通过run_coroutine_threadsafe提交到主事件循环执行，线程中的事件循环只等待结果；
+    普通属性和同步方法直接访问。
+    """
+    __slots__ = ("_target", "_loop")
+
+    def __init__(self, target: Any, loop: asyncio.AbstractEventLoop):
+        self._target = target
+        self._loop = loop
+
+    def __getattr__(self, name: str) -> Any:
+        value = getattr(self._target, name)
+        if not inspect.iscoroutinefunction(value):
+            return value
+        loop = self._loop
+
+        async def call_in_loop(*args, **kwargs):
+            future = asyncio.run_coroutine_threadsafe(value(*args, **kwargs), loop)
+            return await asyncio.wrap_future(future)
+        return call_in_loop
+
+
+class ThreadOffloader:
+    """
+    有界线程池，用于执行包含阻塞调用的模块
+
+    同步的execute直接在线程中调用；异步的execute在线程自己的事件循环中运行，
+    其中的阻塞调用只会占用该线程，不影响主事件循环上的其他命令。
+    注意：线程中的事件循环不能直接使用绑定在主事件循环上的对象，event_context等对象需要用proxy()包装，
+    共享的HTTP客户端会为每个事件循环单独创建。
+    超时取消只能停止等待，已经开始的阻塞调用会在线程中继续执行直到返回，并继续计入active。
+    """
+    def __init__(self, max_workers: int = DEFAULT_MAX_WORKERS):
+        self.max_workers = max_workers
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        # 正在线程池中执行或排队的任务数（包括等待方已超时、但线程仍在执行的任务）
+        self.active = 0
+
+    def configure(self, max_workers: int) -> None:
+        """
+        修改线程池大小，正在执行的任务不受影响
+        """
+        max_workers = max(1, int(max_workers))
+        if max_workers == self.max_workers:
+            return
+        self.max_workers = max_workers
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+            self._executor = None
+
+    @property
+    def executor(self) -> ThreadPoolExecutor:
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.max_workers,
+                                                thread_name_prefix="langbotbox-blocking")
+        return self._executor
+
+    def _call(self, func: Callable, args: tuple) -> Any:
+        result = func(*args)
+        if inspect.isawaitable(result):
+            # 每个线程复用一个事件循环，避免每次调用都创建新的事件循环
+            loop = getattr(self._local, 'loop', None)
+            if loop is None:
+                loop = self._local.loop = asyncio.new_event_loop()
+            result = loop.run_until_complete(result)
+        return result
+
+    async def run(self, func: Callable, *args) -> Any:
+        """
+        在线程池中调用func(*args)，func可以是普通函数或异步函数
+        """
+        with self._lock:
+            self.active += 1
+        future = self.executor.submit(self._call, func, args)
+        # 在任务真正结束（或排队时被取消）后才减少计数，等待方被取消时线程可能仍在执行
+        future.add_done_callback(self._done)
+        return await asyncio.wrap_future(future)
+
+    def _done(self, future) -> None:
+        with self._lock:
+            self.active -= 1
+
+    @staticmethod
+    def proxy(target: Any) -> Any:
+        """
+        包装当前事件循环上的对象，供线程池中的任务使用，target为None时返回None
+        """
+        if target is None:
+            return None
+        return LoopProxy(target, asyncio.get_running_loop())
+
+    def shutdown(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+            self._executor = None
+
+
+# 创建全局实例
+offloader = ThreadOffloader()
+
+
+# 提供便捷函数
+def configure(max_workers: int) -> None:
+    offloader.configure(max_workers)
+
+async def run(func: Callable, *args) -> Any:
+    return await offloader.run(func, *args)
+
+def proxy(target: Any) -> Any:
+    return offloader.proxy(target)
@@ -3,7 +3,7 @@ import asyncio
 import re  # 用于提取数字
 from langbot_plugin.api.entities import context
 from typing import Dict
-import httpx
+from core import http_client
 
 # 使用get_info()函数提供模块信息
 def get_info() -> Dict[str, str]:
@@ -19,21 +19,20 @@ def get_info() -> Dict[str, str]:
         "usage": "看妹妹 [数量]  # 如 看妹妹 3 获取3张图片，最多10张"
     }
 
-async def fetch_color_image(max_retries=3):
+async def fetch_color_image(client, max_retries=3):
     """获取图片链接（带重试机制）"""
     api_url = "https://3650000.xyz/api/?type=json&mode=1,3,5,8"
     for attempt in range(max_retries):
         try:
-            async with httpx.AsyncClient() as client:
-                response = await client.get(api_url)
-                if response.status_code == 200:
-                    response_data = response.json()
-                    if response_data.get("code") == 200:
-                        return response_data.get("url")
-                    else:
-                        error_msg = f"API异常 code={response_data.get('code')} [尝试 {attempt+1}/{max_retries}]"
+            response = await client.get(api_url)
+            if response.status_code == 200:
+                response_data = response.json()
+                if response_data.get("code") == 200:
+                    return response_data.get("url")
                 else:
-                    error_msg = f"状态码错误 {response.status_code} [尝试 {attempt+1}/{max_retries}]"
+                    error_msg = f"API异常 code={response_data.get('code')} [尝试 {attempt+1}/{max_retries}]"
+            else:
+                error_msg = f"状态码错误 {response.status_code} [尝试 {attempt+1}/{max_retries}]"
         except httpx.RequestError:
             error_msg = f"网络错误 [尝试 {attempt+1}/{max_retries}]"
         except Exception as e:
@@ -72,7 +71,8 @@ async def execute(event_context: context.EventContext, request_dict) -> str:
     request_count = max(1, min(n, ssnum))
     
     # 并发请求
-    tasks = [fetch_color_image() for _ in range(request_count)]
+    client = request_dict.get('http_client') or http_client.get_client()
+    tasks = [fetch_color_image(client) for _ in range(request_count)]
     results = await asyncio.gather(*tasks)
     
     # 构建结果
@@ -1,6 +1,6 @@
-import httpx
 from langbot_plugin.api.entities import context
 from typing import Dict
+from core import http_client
 
 # 使用get_info()函数提供模块信息
 def get_info() -> Dict[str, str]:
@@ -16,19 +16,18 @@ def get_info() -> Dict[str, str]:
         "usage": "摸头 @好友 或者 摸头 @1001 或者 摸头"
     }
 
-async def get_motou_image_url(qq=None, bg_color=None):
+async def get_motou_image_url(client, qq=None, bg_color=None):
     """获取摸头图片链接"""
     api_url = f"https://uapis.cn/api/v1/image/motou?qq={qq}"
     if bg_color:
         api_url += f"&bg_color={bg_color}"
     # print(f'api_url={api_url}')
     try:
-        async with httpx.AsyncClient() as client:
-            response = await client.get(api_url)
-            if response.status_code == 200:
-                return api_url
-            else:
-                return "获取摸头图片失败\n输入的格式是:摸头@好友 或者摸头 @1001"
+        response = await client.get(api_url)
+        if response.status_code == 200:
+            return api_url
+        else:
+            return "获取摸头图片失败\n输入的格式是:摸头@好友 或者摸头 @1001"
     except Exception as e:
         return "发生错误喵~"
 
@@ -62,7 +61,8 @@ async def execute(event_context: context.EventContext, request_dict) -> str:
     print(f'qq_number={qq_number}')
 
     # 获取摸头图片链接
-    motou_image_url = await get_motou_image_url(qq=qq_number, bg_color=bg_color)
+    client = request_dict.get('http_client') or http_client.get_client()
+    motou_image_url = await get_motou_image_url(client, qq=qq_number, bg_color=bg_color)
     
     # 检查是否获取成功
     if motou_image_url.startswith("http"):
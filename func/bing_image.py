@@ -1,6 +1,7 @@
 from langbot_plugin.api.entities import context
 from typing import List, Dict
-import requests
+from core import http_client
+from core.result_cache import uncached
 
 # 使用get_info()函数提供模块信息
 def get_info() -> Dict[str, str]:
@@ -14,7 +15,11 @@ def get_info() -> Dict[str, str]:
         "keyword": "bing",
         "description": "获取Bing每日图片",
         "usage": "bing [day] [size]",
-        "example": "bing\nbing 0 1920×1080\nbing 1"
+        "example": "bing\nbing 0 1920×1080\nbing 1",
+        # 同一天内相同的(day, size)得到的图片相同
+        "cache_expire": "midnight",
+        "cache_key": ["args"],
+        "coalesce": True
     }
 
 async def execute(event_context: context.EventContext, request_dict) -> str:
@@ -50,19 +55,21 @@ async def execute(event_context: context.EventContext, request_dict) -> str:
             size = args[1]
     
     # 获取Bing图片URL
-    image_url = get_bing_image_url(day, size)
+    client = request_dict.get('http_client') or http_client.get_client()
+    image_url = await get_bing_image_url(client, day, size)
     
     if image_url:
         # 返回Markdown格式的图片链接
         return f"今日Bing图片：\n![Bing Image]({image_url})"
     else:
-        return "获取Bing图片失败，请稍后再试"
+        return uncached("获取Bing图片失败，请稍后再试")
 
-def get_bing_image_url(day=0, size=None):
+async def get_bing_image_url(client, day=0, size=None):
     """
     获取Bing图片的URL
     
     Args:
+        client: 共享的HTTP客户端
         day: 表示获取哪一天的图片，0表示今天，1表示昨天
         size: 表示图片大小，如1920×1080
     
@@ -79,10 +86,10 @@ def get_bing_image_url(day=0, size=None):
         params["size"] = size
 
     try:
-        response = requests.get(api_url, params=params)
+        response = await client.get(api_url, params=params)
         if response.status_code == 200:
             # 直接使用该URL链接的图片
-            return response.url
+            return str(response.url)
         else:
             print(f"获取Bing图片失败，状态码：{response.status_code}")
             return None
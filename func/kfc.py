@@ -1,7 +1,8 @@
-import requests
+import httpx
 import json
 from langbot_plugin.api.entities import context
 from typing import Dict
+from core import http_client
 
 # 使用get_info()函数提供模块信息
 def get_info() -> dict:
@@ -15,7 +16,10 @@ def get_info() -> dict:
         "keyword": "kfc",
         "description": "获取肯德基疯狂星期四文案",
         "usage": "kfc",
-        "need_at": False
+        "need_at": False,
+        # 同时到达的kfc请求共享一次接口调用
+        "coalesce": True,
+        "coalesce_key": []
     }
 
 async def execute(event_context: context.EventContext, request_dict: Dict) -> str:
@@ -31,7 +35,8 @@ async def execute(event_context: context.EventContext, request_dict: Dict) -> st
     """
     try:
         url = "https://api.ahfi.cn/api/kfcv50?type=json"
-        response = requests.get(url)
+        client = request_dict.get('http_client') or http_client.get_client()
+        response = await client.get(url)
         response.raise_for_status()
         
         data = response.json()
@@ -40,7 +45,7 @@ async def execute(event_context: context.EventContext, request_dict: Dict) -> st
         else:
             return f"获取肯德基疯狂星期四文案失败: {data.get('msg', '未知错误')}"
             
-    except requests.exceptions.RequestException as e:
+    except httpx.HTTPError as e:
         return f"请求出错: {str(e)}"
     except json.JSONDecodeError:
         return "解析响应失败: 返回的不是有效的JSON格式"
@@ -2,6 +2,7 @@
 
 from langbot_plugin.api.entities import context
 from typing import Dict
+from core.message_processor import escape_markup
 
 # 使用get_info()函数提供模块信息
 def get_info() -> dict:
@@ -90,4 +91,5 @@ async def execute(event_context: context.EventContext, request_dict: Dict) -> st
     result.append("   - 易于扩展：未来可以根据需要添加更多信息到request_dict中")
     result.append("   - 向后兼容：可以在request_dict中包含原有的args信息")
     
-    return "\n".join(result)
\ No newline at end of file
+    # 结果中包含用户输入，转义其中的图片和@标记，避免被当作标记处理
+    return escape_markup("\n".join(result))
\ No newline at end of file
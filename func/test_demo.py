@@ -3,6 +3,7 @@
 from langbot_plugin.api.entities import context
 from typing import Dict
 import os
+from core.message_processor import escape_markup
 
 # 使用get_info()函数提供模块信息
 def get_info() -> Dict[str, str]:
@@ -43,8 +44,8 @@ async def execute(event_context: context.EventContext, request_dict: Dict) -> st
     example_image_url = "https://static.moontung.top/2024/202405141832929.jpeg"
     
     if args:
-        # 如果有参数，返回参数内容加上图片
-        args_content = " ".join(args)
+        # 如果有参数，返回参数内容加上图片，用户输入中的标记需要转义
+        args_content = escape_markup(" ".join(args))
     else:
         args_content = "无传入参数"
     return (
@@ -53,5 +54,7 @@ async def execute(event_context: context.EventContext, request_dict: Dict) -> st
         f"网络示例图片1：![示例图片]({example_image_url})\n"
         f"文本2\n"
         f"网络示例图片2：![示例图片]({example_image_url})\n"
-        f"本地图片示例：![本地图片](/home/sheetung/langbot-plugin-all/LangBotPluginBox/assets/icon.png)\n"
+        f"本地图片示例：![本地图片](assets/icon.png)\n"
+        f"<!--break-->\n"
+        f"第二条消息，@发送者：@{{{sender_id}}}\n"
     )
@@ -1,7 +1,19 @@
-import requests
+import asyncio
 import json
+import os
+import threading
+import yaml
 from langbot_plugin.api.entities import context
 from typing import Dict
+from core import http_client
+from core.lru_cache import TTLCache
+from core.message_processor import escape_markup
+
+# 城市名称到Location ID的映射基本不会变化，缓存30天并持久化到config目录
+LOCATION_CACHE_TTL = 30 * 24 * 3600
+LOCATION_CACHE_SIZE = 2048
+LOCATION_CACHE_FILE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                                   'config', 'weather_locations.yaml')
 
 # 使用get_info()函数提供模块信息
 def get_info() -> dict:
@@ -13,9 +25,14 @@ def get_info() -> dict:
     """
     return {
         "keyword": "天气",
+        "aliases": ["weather", "tq"],
         "description": "获取指定城市的实时天气和未来三天天气预报",
         "usage": "天气 <城市名称>",
-        "need_at": False
+        "need_at": False,
+        # 同一城市的并发查询共享一次请求
+        "coalesce": True,
+        # 限制调用频率，避免消耗过多和风天气的请求额度
+        "rate_limit": {"user": "5/60", "keyword": "60/60"}
     }
 
 async def execute(event_context: context.EventContext, request_dict: Dict) -> str:
@@ -48,15 +65,19 @@ async def execute(event_context: context.EventContext, request_dict: Dict) -> st
     # 获取城市名称，默认为"贵阳"
     city_name = args[0] if args else "贵阳"
     
+    client = request_dict.get('http_client') or http_client.get_client()
+    
     try:
         # 获取Location ID
-        location_id = get_location_id(weather_key, weather_api_host, city_name)
+        location_id = await get_location_id(client, weather_key, weather_api_host, city_name)
         if not location_id:
-            return f"无法获取城市'{city_name}'的位置信息，请检查城市名称是否正确"
+            return f"无法获取城市'{escape_markup(city_name)}'的位置信息，请检查城市名称是否正确"
 
-        # 获取实时天气和未来三天天气预报
-        realtime_weather = get_realtime_weather(weather_key, weather_api_host, location_id)
-        forecast_weather = get_forecast_weather(weather_key, weather_api_host, location_id)
+        # 并发获取实时天气和未来三天天气预报
+        realtime_weather, forecast_weather = await asyncio.gather(
+            get_realtime_weather(client, weather_key, weather_api_host, location_id),
+            get_forecast_weather(client, weather_key, weather_api_host, location_id),
+        )
         
         # 处理天气数据并返回结果
         if realtime_weather and forecast_weather:
@@ -66,13 +87,67 @@ async def execute(event_context: context.EventContext, request_dict: Dict) -> st
             return "获取天气数据失败，请检查网络或API配置"
             
     except Exception as e:
-        return f"获取天气信息时发生错误: {str(e)}"
+        # 异常信息中可能包含用户输入的城市名称
+        return f"获取天气信息时发生错误: {escape_markup(str(e))}"
+
+def _load_location_cache() -> TTLCache:
+    """
+    从YAML文件加载城市Location ID缓存
+    """
+    cache = TTLCache(maxsize=LOCATION_CACHE_SIZE, ttl=LOCATION_CACHE_TTL)
+    try:
+        if os.path.exists(LOCATION_CACHE_FILE):
+            with open(LOCATION_CACHE_FILE, 'r', encoding='utf-8') as f:
+                data = yaml.safe_load(f) or {}
+            for location_name, item in (data.get('locations') or {}).items():
+                cache.set(location_name, item['id'], expires_at=item['expires_at'])
+    except Exception as e:
+        print(f"加载城市Location ID缓存失败: {e}")
+    return cache
+
 
-def get_location_id(api_key, api_host, location_name):
+def _dump_location_cache() -> Dict:
     """
-    通过GeoAPI获取城市的Location ID
+    在事件循环中生成缓存的快照，写文件的线程不直接读取正在被修改的缓存
+    """
+    return {'locations': {
+        location_name: {'id': location_id, 'expires_at': expires_at}
+        for location_name, location_id, expires_at in _location_cache.items()
+    }}
+
+
+def _save_location_cache(data: Dict, version: int) -> None:
+    """
+    将城市Location ID缓存保存到YAML文件，先写临时文件再替换，避免写到一半时文件损坏
+    多个保存依次执行，已经写入更新的快照时跳过旧的快照
+    """
+    global _saved_version
+    with _save_lock:
+        if version <= _saved_version:
+            return
+        try:
+            tmp_file = f"{LOCATION_CACHE_FILE}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(tmp_file, 'w', encoding='utf-8') as f:
+                yaml.safe_dump(data, f, allow_unicode=True, default_flow_style=False)
+            os.replace(tmp_file, LOCATION_CACHE_FILE)
+            _saved_version = version
+        except Exception as e:
+            print(f"保存城市Location ID缓存失败: {e}")
+
+
+_location_cache = _load_location_cache()
+# 缓存每次修改后加1，用于判断快照的新旧
+_cache_version = 0
+_saved_version = 0
+_save_lock = threading.Lock()
+
+
+async def get_location_id(client, api_key, api_host, location_name):
+    """
+    获取城市的Location ID，优先使用缓存，未命中时通过GeoAPI查询
 
     Args:
+        client: 共享的HTTP客户端
         api_key: 和风天气API密钥
         api_host: 和风天气API Host
         location_name: 城市名称
@@ -80,18 +155,26 @@ def get_location_id(api_key, api_host, location_name):
     Returns:
         str: Location ID或None（如果获取失败）
     """
+    global _cache_version
+    location_id = _location_cache.get(location_name)
+    if location_id:
+        return location_id
+
     geoapi_url = f"https://{api_host}/geo/v2/city/lookup"
     params = {
         "key": api_key,
         "location": location_name
     }
     try:
-        response = requests.get(geoapi_url, params=params)
+        response = await client.get(geoapi_url, params=params)
         if response.status_code == 200:
             data = response.json()
             if data.get("code") == "200" and data.get("location"):
                 # 获取Location ID
                 location_id = data["location"][0]["id"]
+                _location_cache.set(location_name, location_id)
+                _cache_version += 1
+                await asyncio.to_thread(_save_location_cache, _dump_location_cache(), _cache_version)
                 return location_id
             else:
                 print(f"GeoAPI错误：{data.get('code')}, {data.get('message')}")
@@ -101,11 +184,12 @@ def get_location_id(api_key, api_host, location_name):
         print(f"获取Location ID时出错: {str(e)}")
     return None
 
-def get_realtime_weather(api_key, api_host, location_id):
+async def get_realtime_weather(client, api_key, api_host, location_id):
     """
     获取实时天气
 
     Args:
+        client: 共享的HTTP客户端
         api_key: 和风天气API密钥
         api_host: 和风天气API Host
         location_id: 城市的Location ID
@@ -119,7 +203,7 @@ def get_realtime_weather(api_key, api_host, location_id):
         "location": location_id
     }
     try:
-        response = requests.get(url, params=params)
+        response = await client.get(url, params=params)
         if response.status_code == 200:
             data = response.json()
             if data.get("code") == "200":
@@ -132,11 +216,12 @@ def get_realtime_weather(api_key, api_host, location_id):
         print(f"获取实时天气时出错: {str(e)}")
     return None
 
-def get_forecast_weather(api_key, api_host, location_id):
+async def get_forecast_weather(client, api_key, api_host, location_id):
     """
     获取未来三天天气预报
 
     Args:
+        client: 共享的HTTP客户端
         api_key: 和风天气API密钥
         api_host: 和风天气API Host
         location_id: 城市的Location ID
@@ -150,7 +235,7 @@ def get_forecast_weather(api_key, api_host, location_id):
         "location": location_id
     }
     try:
-        response = requests.get(url, params=params)
+        response = await client.get(url, params=params)
         if response.status_code == 200:
             data = response.json()
             if data.get("code") == "200":
@@ -178,7 +263,7 @@ def process_weather_data(city_name, realtime_weather, forecast_weather):
     now = realtime_weather['now']
     
     result = []
-    result.append(f"📍位置：{city_name}")
+    result.append(f"📍位置：{escape_markup(city_name)}")
     result.append("-" * 15)
     result.append(f"实时天气：{now['text']}")
     result.append(f"当前温度：{now['temp']}℃")
@@ -1,7 +1,8 @@
-import requests
 import re
 from langbot_plugin.api.entities import context
 from typing import Dict
+from core import http_client
+from core.result_cache import uncached
 
 # 使用get_info()函数提供模块信息
 def get_info() -> Dict[str, str]:
@@ -15,7 +16,12 @@ def get_info() -> Dict[str, str]:
         "keyword": "早报",
         "description": "获取每日早报图片",
         "usage": "早报",
-        "need_at": False
+        "need_at": False,
+        # 早报每天更新一次，当天内所有人共享同一结果
+        "cache_expire": "midnight",
+        "cache_key": [],
+        "coalesce": True,
+        "coalesce_key": []
     }
 
 async def execute(event_context: context.EventContext, request_dict) -> str:
@@ -33,7 +39,8 @@ async def execute(event_context: context.EventContext, request_dict) -> str:
     api_url = "https://zaobao.wpush.cn/api/zaobao/today"
     
     try:
-        response = requests.get(api_url)
+        client = request_dict.get('http_client') or http_client.get_client()
+        response = await client.get(api_url)
         # 检查请求是否成功
         if response.status_code == 200:
             # 解析 JSON 数据
@@ -46,16 +53,16 @@ async def execute(event_context: context.EventContext, request_dict) -> str:
                     return f"![早报图片]({image})"
                 else:
                     print("未找到有效的 image 链接")
-                    return "未找到有效的早报图片链接"
+                    return uncached("未找到有效的早报图片链接")
             else:
                 print(f"API 返回失败：{data.get('message', '未知错误')}")
-                return f"获取早报数据失败：{data.get('message', '未知错误')}"
+                return uncached(f"获取早报数据失败：{data.get('message', '未知错误')}")
         else:
             print(f"获取数据失败，状态码：{response.status_code}")
-            return f"获取早报数据失败，状态码：{response.status_code}"
+            return uncached(f"获取早报数据失败，状态码：{response.status_code}")
     except Exception as e:
         print(f"发生错误：{e}")
-        return f"获取早报图片时发生错误：{str(e)}"
+        return uncached(f"获取早报图片时发生错误：{str(e)}")
 
 if __name__ == "__main__":
     import asyncio